@@ -1,15 +1,47 @@
 import streamlit as st
 import os
+import threading
+import time
+import uuid
 from PIL import Image
-import tempfile
-from trial import extract_text, extract_text_from_image, extract_text_from_pdf
-import requests
-import json
-import pytesseract
-import google.generativeai as genai
+import trial
+from ocr_cache import get_default_cache
+from job_queue import QueueFull, get_default_scheduler, FINISHED, DONE
+from lab_values import extract_lab_values, format_records
+import tracing
+import llm_cache
+import llm_providers
+import prompt_builder
 
-# Set Tesseract path for Windows
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+# Set Tesseract path for Windows (only there, so pytesseract isn't imported up front elsewhere)
+if os.name == "nt":
+    trial.pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+
+GEMINI_API_KEY = "____________________"
+GEMINI_MODEL = "gemini-2.5-flash"  # Use Gemini 2.5
+JOB_POLL_S = 0.5  # how often a session checks on its extraction job
+
+# Identifies this browser session to the shared job queue, for per-user fairness
+if "user_id" not in st.session_state:
+    st.session_state.user_id = uuid.uuid4().hex
+
+@st.cache_resource
+def get_gemini_provider():
+    """
+    Creates the Gemini provider once per process; its pooled connections and
+    concurrency limit are shared by all reruns and sessions.
+    """
+    return llm_providers.get_provider("gemini", GEMINI_API_KEY, model=GEMINI_MODEL)
+
+@st.cache_resource(show_spinner=False)
+def start_prewarm():
+    """
+    Loads the OCR dependencies in the background once per process, so the page
+    renders straight away and the first analysis doesn't pay for the imports.
+    """
+    thread = threading.Thread(target=trial.prewarm, name="prewarm", daemon=True)
+    thread.start()
+    return thread
 
 # Set page config
 st.set_page_config(
@@ -18,6 +50,8 @@ st.set_page_config(
     layout="wide"
 )
 
+start_prewarm()
+
 # Custom CSS
 st.markdown("""
     <style>
@@ -74,6 +108,27 @@ with st.sidebar:
         ["Full Analysis", "Quick Summary", "Value Extraction Only"]
     )
 
+    cache_stats = get_default_cache().stats()
+    st.caption(
+        f"🗄️ OCR cache: {cache_stats['memory_hits'] + cache_stats['disk_hits']} hits, "
+        f"{cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%} hit rate)"
+    )
+    llm_stats = llm_cache.get_default_cache().stats()
+    st.caption(
+        f"🤖 Analysis cache: {llm_stats['hits']} hits, {llm_stats['misses']} misses "
+        f"({llm_stats['hit_rate']:.0%} hit rate, {llm_stats['latency_saved_s']:.1f}s saved)"
+    )
+
+    queue_stats = get_default_scheduler().stats()
+    st.caption(
+        f"🧵 OCR queue: {queue_stats['running']} running, {queue_stats['queued']} waiting "
+        f"({queue_stats['coalesced']} duplicate uploads shared)"
+    )
+
+    if tracing.enabled:
+        with st.expander("📈 Stage Metrics"):
+            st.code(tracing.export_prometheus(), language="text")
+
 # Main content
 col1, col2 = st.columns([1, 1])
 
@@ -100,56 +155,90 @@ with col2:
     if uploaded_file is not None:
         if st.button("🔬 Analyze Report", use_container_width=True):
             with st.spinner("🔄 Processing your medical report..."):
-                # Save uploaded file temporarily
-                with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp_file:
-                    tmp_file.write(uploaded_file.getvalue())
-                    tmp_file_path = tmp_file.name
-                
                 try:
-                    # Extract text using your backend
-                    extracted_text = extract_text(tmp_file_path)
+                    # Extraction runs on the shared job queue so concurrent sessions don't
+                    # oversubscribe the CPU; poll it and show each page as soon as it is done
+                    scheduler = get_default_scheduler()
+                    job_id = scheduler.submit(st.session_state.user_id, uploaded_file.getvalue(),
+                                              uploaded_file.name)
+                    with st.expander("📝 Extracted Text", expanded=True):
+                        progress = st.progress(0.0, text="Waiting for a free OCR worker...")
+                        text_placeholder = st.empty()
+                        extracted_text = ""
+                        page_texts = []
+                        while True:
+                            job = scheduler.status(job_id, since=len(page_texts))
+                            for page in job["pages"]:
+                                extracted_text += page["text"]
+                                page_texts.append(page["text"])
+                            text_placeholder.text(extracted_text)
+                            if job["status"] in FINISHED:
+                                break
+                            if job["position"] is not None:
+                                progress.progress(0.0, text=f"⏳ In queue: {job['position']} report(s) ahead of yours")
+                            elif job["page_count"]:
+                                progress.progress(job["pages_done"] / job["page_count"],
+                                                  text=f"Page {job['pages_done']} of {job['page_count']}")
+                            else:
+                                progress.progress(0.0, text="Extracting text...")
+                            time.sleep(JOB_POLL_S)
+                        progress.empty()
+                    if job["status"] != DONE:
+                        raise RuntimeError(job["error"] or f"extraction {job['status']}")
+                    
+                    # Structured values are extracted locally, no LLM round-trip needed
+                    lab_records = extract_lab_values(extracted_text)
                     
-                    # Display extracted text
-                    with st.expander("📝 Extracted Text", expanded=False):
-                        st.text_area("Raw OCR Output", extracted_text, height=200)
+                    if analysis_type == "Value Extraction Only":
+                        st.markdown("### 🧪 Extracted Values")
+                        if lab_records:
+                            st.dataframe(lab_records, use_container_width=True)
+                        else:
+                            st.warning("⚠️ No known lab values found in this report.")
+                        st.download_button(
+                            label="📥 Download Values",
+                            data=format_records(lab_records),
+                            file_name="medical_report_values.txt",
+                            mime="text/plain"
+                        )
                     
                     # Analyze with Gemini using REST API
-                    if extracted_text and extracted_text.strip():
-                        GEMINI_API_KEY = "____________________"
-                        genai.configure(api_key=GEMINI_API_KEY)
-                        
-                        model = genai.GenerativeModel('gemini-2.5-flash')  # Use Gemini 2.5
-                        prompt = f"""
-                        Analyze this medical report and provide:
-                        1. **Report Type**: Identify what kind of medical test/report this is
-                        2. **Key Values**: List all important medical values with their units
-                        3. **Normal Ranges**: Show normal ranges for each value
-                        4. **Interpretation**: Explain what the values mean in simple terms
-                        5. **Abnormal Findings**: Highlight any values outside normal range
-                        6. **Recommendations**: Suggest if consultation with a doctor is needed
-                        
-                        Medical Report Text:
-                        {extracted_text}
-                        
-                        Format your response clearly with headers and bullet points.
-                        """
-                        response = model.generate_content(prompt)
+                    elif extracted_text and extracted_text.strip():
+                        report_pages = prompt_builder.report_pages(page_texts, lab_records)
+                        instructions = prompt_builder.ANALYSIS_INSTRUCTIONS[analysis_type]
+                        response_cache = llm_cache.get_default_cache()
+                        cache_key = response_cache.make_key(prompt_builder.compact_pages(report_pages),
+                                                            prompt_builder.PROMPT_VERSION, analysis_type, GEMINI_MODEL)
+                        analysis = response_cache.get(cache_key)
                         st.markdown("### 🤖 AI Analysis")
-                        st.markdown(response.text)
+                        if analysis is not None:
+                            st.caption("♻️ Served from the analysis cache")
+                            st.markdown(analysis)
+                        else:
+                            # Long reports are analyzed in parallel chunks first, then merged by the streamed call
+                            start = time.perf_counter()
+                            prompt, prompt_stats = prompt_builder.build_prompt(instructions, report_pages,
+                                                                               provider=get_gemini_provider(),
+                                                                               raw_pages=page_texts)
+                            parts = f", report split into {prompt_stats['chunks']} parts" if prompt_stats["chunks"] > 1 else ""
+                            st.caption(f"🧮 Prompt ≈ {prompt_stats['prompt_tokens']:,} tokens "
+                                       f"({prompt_stats['tokens_saved']:,} saved by compaction{parts})")
+                            # Render the analysis as it is generated instead of waiting for all of it
+                            analysis = st.write_stream(get_gemini_provider().stream(prompt))
+                            if analysis:
+                                response_cache.put(cache_key, analysis, model=GEMINI_MODEL,
+                                                   latency_s=time.perf_counter() - start)
                         st.download_button(
                             label="📥 Download Analysis",
-                            data=f"EXTRACTED TEXT:\n{extracted_text}\n\n{'='*50}\n\nAI ANALYSIS:\n{response.text}",
+                            data=f"EXTRACTED TEXT:\n{extracted_text}\n\n{'='*50}\n\nAI ANALYSIS:\n{analysis}",
                             file_name="medical_report_analysis.txt",
                             mime="text/plain"
                         )
                 
+                except QueueFull as e:
+                    st.warning(f"🚦 {e}")
                 except Exception as e:
                     st.error(f"❌ Error processing file: {str(e)}")
-                
-                finally:
-                    # Cleanup temp file
-                    if os.path.exists(tmp_file_path):
-                        os.remove(tmp_file_path)
     else:
         st.info("👆 Please upload a medical report to begin analysis")
 
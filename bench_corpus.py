@@ -0,0 +1,177 @@
+import json
+import os
+import random
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+from lab_values import ANALYTES
+
+# A4 at 150 DPI for rendered pages; PDF pages use 595x842 points
+PAGE_SIZE = (1240, 1754)
+PDF_PAGE_SIZE = (595, 842)
+COLUMNS = (0.08, 0.45, 0.62, 0.78)  # test, result, unit, reference range (fraction of width)
+
+HEADER = "CITY DIAGNOSTIC LABORATORY"
+FOOTER = "This is a computer generated report. Please correlate clinically."
+
+
+def make_report_pages(rng, page_count, rows_per_page=12):
+    """
+    Builds the content of a synthetic lab report: per page a list of table rows
+    (test, result, unit, reference range). Values are drawn around each analyte's
+    reference range so roughly a third of them are flagged.
+    """
+    names = list(ANALYTES)
+    pages = []
+    for _ in range(page_count):
+        rows = []
+        for name in rng.sample(names, rows_per_page):
+            _, unit, (low, high) = ANALYTES[name]
+            span = (high - low) or max(high, 1.0)
+            value = rng.uniform(max(0.0, low - span * 0.3), high + span * 0.3)
+            decimals = 0 if high >= 100 else 1
+            rows.append((name, f"{value:.{decimals}f}", unit, f"{low:g} - {high:g}"))
+        pages.append(rows)
+    return pages
+
+
+def ground_truth(pages):
+    """
+    Returns the expected (test, value) records of a report for accuracy scoring.
+    """
+    return [{"test": name, "value": float(result)} for rows in pages for name, result, _, _ in rows]
+
+
+def _load_font(size):
+    for name in ("DejaVuSans.ttf", "arial.ttf", "Arial.ttf"):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=size)
+
+
+def render_page_image(rows, page_number, noise=0, seed=0):
+    """
+    Draws one report page as a grayscale PIL image, optionally degraded like a scan:
+    noise 1 adds sensor noise and a slight skew, noise 2 also blurs and skews more.
+    """
+    width, height = PAGE_SIZE
+    img = Image.new("L", PAGE_SIZE, 255)
+    draw = ImageDraw.Draw(img)
+    title_font, font = _load_font(34), _load_font(22)
+
+    draw.text((int(width * COLUMNS[0]), 90), HEADER, font=title_font, fill=0)
+    draw.text((int(width * COLUMNS[0]), 150), f"Patient: Test Patient    Page {page_number}", font=font, fill=0)
+    y = 240
+    for x, label in zip(COLUMNS, ("Test", "Result", "Unit", "Reference Range")):
+        draw.text((int(width * x), y), label, font=font, fill=0)
+    y += 50
+    for row in rows:
+        for x, cell in zip(COLUMNS, row):
+            draw.text((int(width * x), y), cell, font=font, fill=0)
+        y += 44
+    draw.text((int(width * COLUMNS[0]), height - 120), FOOTER, font=font, fill=0)
+
+    if noise:
+        rng = np.random.default_rng(seed)
+        img = img.rotate(rng.uniform(-0.5, 0.5) * noise, resample=Image.BICUBIC, fillcolor=255)
+        if noise >= 2:
+            img = img.filter(ImageFilter.GaussianBlur(0.8))
+        pixels = np.asarray(img, dtype=np.float32) + rng.normal(0, 10 * noise, (height, width))
+        img = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    return img
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_text_pdf(path, pages):
+    """
+    Writes a digital (text layer) PDF with Helvetica text laid out in table columns,
+    without any PDF library.
+    """
+    width, height = PDF_PAGE_SIZE
+    streams = []
+    for page_number, rows in enumerate(pages, start=1):
+        ops = [f"BT /F1 16 Tf 1 0 0 1 50 {height - 60} Tm ({_pdf_escape(HEADER)}) Tj ET",
+               f"BT /F1 10 Tf 1 0 0 1 50 {height - 85} Tm (Patient: Test Patient    Page {page_number}) Tj ET"]
+        y = height - 130
+        for row in [("Test", "Result", "Unit", "Reference Range")] + list(rows):
+            for x, cell in zip(COLUMNS, row):
+                ops.append(f"BT /F1 10 Tf 1 0 0 1 {int(width * x)} {y} Tm ({_pdf_escape(cell)}) Tj ET")
+            y -= 20
+        ops.append(f"BT /F1 9 Tf 1 0 0 1 50 50 Tm ({_pdf_escape(FOOTER)}) Tj ET")
+        streams.append("\n".join(ops).encode("latin-1"))
+
+    # Objects: 1 catalog, 2 page tree, 3 font, then a page and its content stream per page
+    page_ids = [4 + 2 * i for i in range(len(pages))]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(pages)} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    for page_id, stream in zip(page_ids, streams):
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>".encode())
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for obj_id, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{obj_id} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def write_scanned_pdf(path, pages, noise=0, seed=0):
+    """
+    Writes an image-only PDF, one rendered (and optionally degraded) page per sheet.
+    """
+    images = [render_page_image(rows, n, noise=noise, seed=seed + n) for n, rows in enumerate(pages, start=1)]
+    images[0].save(path, "PDF", resolution=150, save_all=True, append_images=images[1:])
+
+
+def build_corpus(out_dir, page_counts=(1, 5, 10), noise_levels=(0, 1, 2), seed=1234):
+    """
+    Generates the benchmark corpus into `out_dir` and returns its manifest: a list of
+    {"name", "path", "kind", "pages", "noise", "truth"} entries. The same seed always
+    produces the same documents.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    docs = []
+
+    def add(name, kind, pages, noise, writer):
+        path = os.path.join(out_dir, name)
+        writer(path)
+        docs.append({"name": name, "path": path, "kind": kind, "pages": len(pages),
+                     "noise": noise, "truth": ground_truth(pages)})
+
+    for noise in noise_levels:
+        pages = make_report_pages(rng, 1)
+        ext = "png" if noise == 0 else "jpg"
+        add(f"image_noise{noise}.{ext}", "image", pages, noise,
+            lambda path, pages=pages, noise=noise: render_page_image(pages[0], 1, noise, seed).save(path))
+
+    for count in page_counts:
+        pages = make_report_pages(rng, count)
+        add(f"text_{count}p.pdf", "text_pdf", pages, None,
+            lambda path, pages=pages: write_text_pdf(path, pages))
+
+    for count in page_counts:
+        for noise in noise_levels:
+            pages = make_report_pages(rng, count)
+            add(f"scan_{count}p_noise{noise}.pdf", "scan_pdf", pages, noise,
+                lambda path, pages=pages, noise=noise: write_scanned_pdf(path, pages, noise, seed))
+
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(docs, f, indent=2)
+    return docs
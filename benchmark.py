@@ -0,0 +1,271 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import trial
+import ocr_engine
+import tracing
+from bench_corpus import build_corpus
+from lab_values import extract_lab_values
+
+BUNDLED_SAMPLES = ["blood_report.png"]
+
+
+def peak_rss_mb():
+    """
+    Peak resident memory of this process and of finished children (tesseract runs)
+    over its whole lifetime, in MB; only meaningful for the run as a whole.
+    """
+    if resource is None:
+        return None, None
+    # ru_maxrss is KB on Linux and bytes on macOS
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / divisor
+    return round(own, 1), round(children, 1)
+
+
+def timed(stages, name, fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    stages[name] += time.perf_counter() - start
+    return result
+
+
+def score(text, truth):
+    """
+    Fraction of ground-truth (test, value) pairs recovered by the local lab value extractor.
+    """
+    if not truth:
+        return None
+    found = {(r["test"], r["value"]) for r in extract_lab_values(text)}
+    hits = sum((t["test"], t["value"]) in found for t in truth)
+    return round(hits / len(truth), 4)
+
+
+def run_stages(doc):
+    """
+    Times each pipeline stage separately for one document, then the full extract_text.
+    """
+    stages = defaultdict(float)
+    path, kind = doc["path"], doc["kind"]
+
+    if kind == "text_pdf":
+        timed(stages, "camelot", trial.extract_tables_from_pdf, path)
+        images = []
+    elif kind == "scan_pdf":
+        images = timed(stages, "rasterize", trial.render_pdf_pages, path)
+    else:
+        images = [path]
+
+    for image in images:
+        preprocessed = timed(stages, "preprocess", trial.preprocess_image, image)
+        raw = timed(stages, "tesseract", ocr_engine.image_to_string, preprocessed, trial.custom_config)
+        timed(stages, "clean", trial.clean_ocr_output, raw)
+    del images
+
+    report = {}
+    text = timed(stages, "end_to_end", trial.extract_text, path, cache=False, report=report)
+    return dict(stages), text, report
+
+
+def bench_document(doc, repeat):
+    # Sampled while this document runs; ru_maxrss would report the largest document so far
+    sampler = tracing.MemorySampler()
+    sampler.start()
+    try:
+        runs = [run_stages(doc) for _ in range(repeat)]
+    finally:
+        sampler.stop()
+    stage_names = sorted({name for stages, _, _ in runs for name in stages})
+    medians = {name: round(statistics.median(stages.get(name, 0.0) for stages, _, _ in runs), 4)
+               for name in stage_names}
+    _, text, report = runs[-1]
+    pages = doc.get("pages") or 1
+    return {
+        "name": doc["name"],
+        "kind": doc["kind"],
+        "pages": pages,
+        "noise": doc.get("noise"),
+        "stages_s": medians,
+        "pages_per_s": round(pages / medians["end_to_end"], 3) if medians["end_to_end"] else None,
+        "accuracy": score(text, doc.get("truth")),
+        "peak_rss_mb": round(sampler.peak_mb, 1) if sampler.peak_mb is not None else None,
+        "peak_workers_rss_mb": round(sampler.peak_workers_mb, 1) if sampler.peak_workers_mb is not None else None,
+        "routes": [p.get("route") for p in report.get("pages", [])],
+    }
+
+
+def summarize(results):
+    totals = defaultdict(float)
+    for r in results:
+        for name, seconds in r["stages_s"].items():
+            totals[name] += seconds
+    scored = [r["accuracy"] for r in results if r["accuracy"] is not None]
+    pages = sum(r["pages"] for r in results)
+    own_rss, children_rss = peak_rss_mb()
+    return {
+        "stage_totals_s": {name: round(s, 4) for name, s in sorted(totals.items())},
+        "pages": pages,
+        "pages_per_s": round(pages / totals["end_to_end"], 3) if totals["end_to_end"] else None,
+        "mean_accuracy": round(statistics.mean(scored), 4) if scored else None,
+        "peak_rss_mb": own_rss,
+        "peak_child_rss_mb": children_rss,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure_import_time(module="trial", runs=3):
+    """
+    Imports `module` in fresh interpreters under -X importtime. Returns the fastest
+    run's total in seconds and its slowest direct imports as (name, seconds) pairs.
+    """
+    best = None
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                              capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        if proc.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+        # Lines look like "import time:  self [us] | cumulative | <indent>name", and a
+        # module's own imports are logged before it, one level deeper
+        direct, total = [], None
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            depth = (len(name) - len(name.lstrip())) // 2
+            seconds = int(cumulative) / 1e6
+            if depth == 1:
+                direct.append((name.strip(), seconds))
+            elif depth == 0 and name.strip() == module:
+                total = seconds
+                break
+            elif depth == 0:
+                direct = []  # interpreter startup imports (site), not ours
+        if best is None or total < best[0]:
+            best = (total, sorted(direct, key=lambda e: e[1], reverse=True))
+    return best
+
+
+def check_import_budget(budget_s, module="trial"):
+    """
+    Prints the import time of `module`; returns False if it is over `budget_s`.
+    """
+    total, direct = measure_import_time(module)
+    print(f"import {module}: {total:.3f}s (budget {budget_s:.3f}s)")
+    for name, seconds in direct[:8]:
+        print(f"  {name:<24} {seconds:.3f}s")
+    if total > budget_s:
+        print(f"import {module} is over budget; load heavy dependencies lazily (see lazy_imports.py)")
+        return False
+    return True
+
+
+def compare(current, baseline_path, max_slowdown, max_accuracy_drop):
+    """
+    Prints per-stage changes against a previous results file; returns False on a regression.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    ok = True
+    before, after = baseline["summary"], current["summary"]
+    print(f"\nCompared with {baseline.get('commit') or baseline_path}:")
+    for name, seconds in after["stage_totals_s"].items():
+        old = before["stage_totals_s"].get(name)
+        if not old:
+            continue
+        ratio = seconds / old
+        marker = ""
+        if ratio > max_slowdown:
+            marker, ok = "  <-- slower", False
+        print(f"  {name:<12} {old:8.3f}s -> {seconds:8.3f}s  ({ratio:.2f}x){marker}")
+
+    old_acc, new_acc = before.get("mean_accuracy"), after.get("mean_accuracy")
+    if old_acc is not None and new_acc is not None:
+        marker = ""
+        if old_acc - new_acc > max_accuracy_drop:
+            marker, ok = "  <-- accuracy dropped", False
+        print(f"  {'accuracy':<12} {old_acc:8.3f}  -> {new_acc:8.3f}{marker}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the MediBot extraction pipeline.")
+    parser.add_argument("--corpus-dir", default="bench_corpus")
+    parser.add_argument("--pages", default="1,5,10", help="page counts of generated PDFs")
+    parser.add_argument("--noise", default="0,1,2", help="noise levels of generated scans")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per document; medians are reported")
+    parser.add_argument("--only", help="only run documents whose name contains this")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="previous results file to check for regressions")
+    parser.add_argument("--max-slowdown", type=float, default=1.2)
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.02)
+    parser.add_argument("--import-budget", type=float,
+                        help="only check that `import trial` takes at most this many seconds")
+    args = parser.parse_args()
+
+    if args.import_budget is not None:
+        sys.exit(0 if check_import_budget(args.import_budget) else 1)
+
+    # Stage timings should measure the work, not the first use of lazily imported libraries
+    trial.prewarm()
+
+    docs = build_corpus(args.corpus_dir,
+                        page_counts=[int(p) for p in args.pages.split(",")],
+                        noise_levels=[int(n) for n in args.noise.split(",")],
+                        seed=args.seed)
+    docs += [{"name": p, "path": p, "kind": "image", "pages": 1, "noise": None, "truth": None}
+             for p in BUNDLED_SAMPLES if os.path.exists(p)]
+    if args.only:
+        docs = [d for d in docs if args.only in d["name"]]
+
+    results = []
+    for doc in docs:
+        print(f"Benchmarking {doc['name']}...")
+        result = bench_document(doc, args.repeat)
+        print(f"  {result['stages_s']}  accuracy={result['accuracy']}")
+        results.append(result)
+    # Before the git and import-time subprocesses below count as children
+    summary = summarize(results)
+
+    output = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "warm_engines": ocr_engine.tesserocr is not None,
+        "import_trial_s": round(measure_import_time()[0], 4),
+        "settings": dict(trial.ocr_settings(), workers=trial.ocr_workers, page_window=trial.page_window),
+        "documents": results,
+        "summary": summary,
+    }
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"\nSummary: {output['summary']}")
+    print(f"Results written to {args.output}")
+
+    if args.compare and not compare(output, args.compare, args.max_slowdown, args.max_accuracy_drop):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import csv
+import heapq
+import math
+import os
+import threading
+from collections import Counter, deque
+
+# Doctor directory and where "near me" is measured from (the app's default city is Pune)
+DEFAULT_DIRECTORY = os.environ.get(
+    "MEDIBOT_DOCTOR_DIRECTORY", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "doctors.csv")
+)
+DEFAULT_LOCATION = tuple(float(v) for v in os.environ.get("MEDIBOT_USER_LOCATION", "18.5204,73.8567").split(","))
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def to_unit_vector(lat, lon):
+    """
+    Maps latitude/longitude to a point on the unit sphere, where straight-line
+    distance grows with great-circle distance, so a plain 3-D k-d tree works.
+    """
+    lat, lon = math.radians(lat), math.radians(lon)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+def chord_to_km(chord_sq):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(chord_sq) / 2))
+
+
+def km_to_chord_sq(km):
+    return (2 * math.sin(min(math.pi / 2, km / (2 * EARTH_RADIUS_KM)))) ** 2
+
+
+class KDTree:
+    """
+    Static 3-D k-d tree answering k-nearest-neighbour queries.
+    Nodes are (point index, split axis, left node, right node), -1 for no child.
+    """
+
+    def __init__(self, points):
+        self.points = points
+        self.nodes = []
+        self.root = self._build(list(range(len(points))), 0)
+
+    def _build(self, indices, depth):
+        if not indices:
+            return -1
+        axis = depth % 3
+        indices.sort(key=lambda i: self.points[i][axis])
+        mid = len(indices) // 2
+        node = len(self.nodes)
+        self.nodes.append(None)
+        left = self._build(indices[:mid], depth + 1)
+        right = self._build(indices[mid + 1:], depth + 1)
+        self.nodes[node] = (indices[mid], axis, left, right)
+        return node
+
+    def nearest(self, query, k, max_dist_sq=math.inf):
+        """
+        Returns up to k (squared distance, point index) pairs, closest first.
+        """
+        heap = []  # max-heap of the best k so far, as (-squared distance, index)
+        nodes, points = self.nodes, self.points
+        qx, qy, qz = query
+
+        def bound():
+            return -heap[0][0] if len(heap) == k else max_dist_sq
+
+        def visit(node):
+            i, axis, left, right = nodes[node]
+            px, py, pz = points[i]
+            d = (px - qx) ** 2 + (py - qy) ** 2 + (pz - qz) ** 2
+            if d <= bound():
+                if len(heap) == k:
+                    heapq.heapreplace(heap, (-d, i))
+                else:
+                    heapq.heappush(heap, (-d, i))
+            diff = query[axis] - points[i][axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            if near >= 0:
+                visit(near)
+            if far >= 0 and diff * diff <= bound():
+                visit(far)
+
+        if self.root >= 0 and k > 0:
+            visit(self.root)
+        return sorted((-d, i) for d, i in heap)
+
+
+class DoctorStore:
+    """
+    Doctor directory with one k-d tree per specialty (plus one over everybody),
+    so a specialty filter narrows the search instead of post-filtering results.
+    """
+
+    def __init__(self, doctors):
+        self.doctors = []
+        for doctor in doctors:
+            doctor = dict(doctor)
+            doctor["lat"], doctor["lon"] = float(doctor["lat"]), float(doctor["lon"])
+            self.doctors.append(doctor)
+        points = [to_unit_vector(d["lat"], d["lon"]) for d in self.doctors]
+
+        self._trees = {None: (KDTree(points), list(range(len(points))))}
+        by_specialty = {}
+        for i, doctor in enumerate(self.doctors):
+            by_specialty.setdefault(doctor["specialty"], []).append(i)
+        for specialty, members in by_specialty.items():
+            self._trees[specialty] = (KDTree([points[i] for i in members]), members)
+
+    @classmethod
+    def from_csv(cls, path=DEFAULT_DIRECTORY):
+        with open(path, newline="", encoding="utf-8") as f:
+            return cls(csv.DictReader(f))
+
+    def specialties(self):
+        return [s for s in self._trees if s is not None]
+
+    def nearest(self, lat, lon, k=5, specialty=None, max_km=None):
+        """
+        Returns the k doctors closest to (lat, lon), optionally of one specialty
+        and within `max_km`, closest first; each is a copy with "distance_km" added.
+        """
+        if specialty not in self._trees:
+            return []
+        tree, members = self._trees[specialty]
+        max_dist_sq = km_to_chord_sq(max_km) if max_km is not None else math.inf
+        results = []
+        for dist_sq, i in tree.nearest(to_unit_vector(lat, lon), k, max_dist_sq):
+            doctor = dict(self.doctors[members[i]])
+            doctor["distance_km"] = round(chord_to_km(dist_sq), 2)
+            results.append(doctor)
+        return results
+
+
+class SpecialtyMatcher:
+    """
+    Aho-Corasick automaton over specialty keywords: scores every specialty in a
+    single pass over the text, however many keywords there are.
+    """
+
+    def __init__(self, keywords):
+        self.order = list(keywords)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        for specialty, words in keywords.items():
+            for word in words:
+                node = 0
+                for ch in word.lower():
+                    if ch not in self._goto[node]:
+                        self._goto.append({})
+                        self._fail.append(0)
+                        self._out.append([])
+                        self._goto[node][ch] = len(self._goto) - 1
+                    node = self._goto[node][ch]
+                self._out[node].append(specialty)
+
+        # Breadth-first failure links; each node also inherits its fallback's matches
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(ch, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+                queue.append(child)
+
+    def scores(self, text):
+        """
+        Counts keyword occurrences per specialty.
+        """
+        counts = Counter()
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for ch in text.lower():
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for specialty in out[node]:
+                counts[specialty] += 1
+        return counts
+
+    def best(self, text, default=None):
+        """
+        Returns the specialty with the most keyword hits; ties go to the one listed first.
+        """
+        counts = self.scores(text)
+        if not counts:
+            return default
+        return max(self.order, key=lambda s: (counts[s], -self.order.index(s)))
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store():
+    """
+    Returns the process-wide store over the configured directory, loading it on first use.
+    """
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = DoctorStore.from_csv()
+        return _default_store
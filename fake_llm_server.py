@@ -0,0 +1,237 @@
+import argparse
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Sentences the fake answers are assembled from; chosen by prompt hash so the
+# same prompt always gets the same answer
+FAKE_SENTENCES = [
+    "This looks like a routine blood test report.",
+    "Most values are within their normal ranges.",
+    "A few values are slightly outside the reference range.",
+    "Haemoglobin and red cell indices are reported in the first table.",
+    "Please discuss the highlighted values with your doctor.",
+    "Take the medicine after food with a glass of water.",
+    "Do not exceed the stated dose in 24 hours.",
+    "Consult a General Physician if symptoms persist.",
+]
+
+
+def fake_answer(prompt, sentences=5):
+    """
+    Returns a deterministic pseudo-analysis for `prompt`.
+    """
+    seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16)
+    rng = random.Random(seed)
+    lines = [f"- {rng.choice(FAKE_SENTENCES)}" for _ in range(sentences)]
+    return f"### Simulated analysis ({len(prompt)} characters received)\n" + "\n".join(lines)
+
+
+def count_tokens(text):
+    # Same rough rule of thumb the real APIs average out to for English text
+    return max(1, len(text) // 4)
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the Gemini generateContent and Groq chat completions APIs,
+    including their streaming (server-sent events) forms. Latency, jitter and a
+    failure rate (503 responses) can be injected to exercise retries and hedging.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.0, jitter=0.0, error_rate=0.0,
+                 chunk_delay=0.0, seed=None):
+        super().__init__(address, FakeLLMHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.chunk_delay = chunk_delay
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def gemini_url(self):
+        """
+        Base URL for MEDIBOT_GEMINI_URL.
+        """
+        return self.url
+
+    @property
+    def groq_url(self):
+        """
+        Base URL for MEDIBOT_GROQ_URL.
+        """
+        return f"{self.url}/openai/v1"
+
+    def next_outcome(self):
+        """
+        Decides the delay and whether to fail for the next request.
+        """
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        return delay, fail
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up early (timeouts, abandoned hedges) are expected
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    def start(self):
+        """
+        Serves in a daemon thread and returns the server.
+        """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so clients reuse pooled connections as they would with the real APIs
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_events(self, events):
+        # No length is known up front, so the connection is closed after the stream
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for event in events:
+            payload = event if isinstance(event, str) else json.dumps(event)
+            self.wfile.write(f"data: {payload}\n\n".encode())
+            self.wfile.flush()
+            if self.server.chunk_delay:
+                time.sleep(self.server.chunk_delay)
+
+    def do_GET(self):
+        if self.path == "/healthz":
+            self._send_json(200, {"status": "ok", "requests": self.server.requests})
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send_json(400, {"error": {"message": "Invalid JSON body"}})
+
+        delay, fail = self.server.next_outcome()
+        if delay:
+            time.sleep(delay)
+        if fail:
+            return self._send_json(503, {"error": {"message": "Injected failure", "code": 503}})
+
+        path = self.path.split("?")[0]
+        if ":generateContent" in path or ":streamGenerateContent" in path:
+            self._gemini(body, stream=":streamGenerateContent" in path)
+        elif path.endswith("/chat/completions"):
+            self._groq(body)
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown endpoint {path}"}})
+
+    def _gemini(self, body, stream):
+        if not self.headers.get("x-goog-api-key") and "key=" not in self.path:
+            return self._send_json(401, {"error": {"message": "API key not valid."}})
+        try:
+            prompt = "".join(part.get("text", "") for content in body["contents"] for part in content["parts"])
+        except (KeyError, TypeError):
+            return self._send_json(400, {"error": {"message": "contents[].parts[].text is required"}})
+
+        answer = fake_answer(prompt)
+        usage = {"promptTokenCount": count_tokens(prompt), "candidatesTokenCount": count_tokens(answer)}
+        if not stream:
+            return self._send_json(200, {
+                "candidates": [{"content": {"role": "model", "parts": [{"text": answer}]}, "finishReason": "STOP"}],
+                "usageMetadata": usage,
+            })
+        lines = answer.splitlines(keepends=True)
+        events = [{"candidates": [{"content": {"role": "model", "parts": [{"text": line}]}}]} for line in lines]
+        events[-1]["usageMetadata"] = usage
+        self._send_events(events)
+
+    def _groq(self, body):
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            return self._send_json(401, {"error": {"message": "Invalid API Key"}})
+        try:
+            prompt = "".join(message["content"] for message in body["messages"])
+        except (KeyError, TypeError):
+            return self._send_json(400, {"error": {"message": "messages[].content is required"}})
+
+        answer = fake_answer(prompt)
+        usage = {"prompt_tokens": count_tokens(prompt), "completion_tokens": count_tokens(answer)}
+        model = body.get("model", "fake-model")
+        if not body.get("stream"):
+            return self._send_json(200, {
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer},
+                             "finish_reason": "stop"}],
+                "usage": usage,
+            })
+        events = [{"model": model, "choices": [{"index": 0, "delta": {"content": line}}]}
+                  for line in answer.splitlines(keepends=True)]
+        events.append({"model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                       "x_groq": {"usage": usage}})
+        self._send_events(events + ["[DONE]"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Gemini and Groq APIs.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency, up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    server = FakeLLMServer((args.host, args.port), latency=args.latency, jitter=args.jitter,
+                           error_rate=args.error_rate, chunk_delay=args.chunk_delay, seed=args.seed)
+    print(f"Fake LLM server listening on {server.url}")
+    print(f"  MEDIBOT_GEMINI_URL={server.gemini_url}")
+    print(f"  MEDIBOT_GROQ_URL={server.groq_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
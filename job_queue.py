@@ -0,0 +1,300 @@
+import hashlib
+import itertools
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import tracing
+from trial import init_ocr_worker, iter_extract_text
+
+# OCR processes shared by every session, jobs extracted at once (each feeds pages
+# to the pool), queued jobs accepted in total and per user, and how long finished
+# jobs stay around to be polled
+JOB_WORKERS = int(os.environ.get("MEDIBOT_JOB_WORKERS", str(os.cpu_count() or 2)))
+JOB_CONCURRENCY = int(os.environ.get("MEDIBOT_JOB_CONCURRENCY", "2"))
+JOB_QUEUE_LIMIT = int(os.environ.get("MEDIBOT_JOB_QUEUE_LIMIT", "20"))
+JOB_USER_LIMIT = int(os.environ.get("MEDIBOT_JOB_USER_LIMIT", "2"))
+JOB_RETENTION_S = float(os.environ.get("MEDIBOT_JOB_RETENTION_S", "600"))
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = {DONE, FAILED, CANCELLED}
+
+
+def content_key(digest, filename):
+    """
+    Builds a job key from the hex SHA-256 of a file and its name's extension.
+    """
+    return f"{digest}{os.path.splitext(filename or '')[1].lower()}"
+
+
+class QueueFull(Exception):
+    """
+    Raised when a submission is refused because the queue, or the user's share
+    of it, is full. The message is meant to be shown to the user as is.
+    """
+
+
+class Job:
+    """
+    One extraction, possibly shared by several users who uploaded the same file.
+    `pages` grows as pages finish, so pollers can show them progressively.
+    """
+
+    def __init__(self, key, data, filename, user):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.data = data
+        self.filename = filename
+        self.user = user  # whose queue the job waits in
+        self.users = {user}
+        self.status = QUEUED
+        self.pages = []
+        self.page_count = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.cancelled = threading.Event()
+
+    @property
+    def text(self):
+        return "".join(page["text"] for page in self.pages)
+
+
+class JobScheduler:
+    """
+    Process-wide OCR scheduler shared by all Streamlit sessions. Jobs wait in one
+    queue per user and are started round-robin across users, so one user's batch
+    cannot starve everybody else; a few dispatcher threads run them with their
+    page OCR on one bounded process pool. Submissions of a file that is already
+    queued or running join the existing job instead of starting another.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, concurrency=JOB_CONCURRENCY, queue_limit=JOB_QUEUE_LIMIT,
+                 user_limit=JOB_USER_LIMIT, retention_s=JOB_RETENTION_S, extract=iter_extract_text):
+        self.queue_limit = queue_limit
+        self.user_limit = user_limit
+        self.retention_s = retention_s
+        self._extract = extract
+        self._workers = workers
+        self._pool = ProcessPoolExecutor(max_workers=workers, initializer=init_ocr_worker) if workers > 1 else None
+        self.pool_restarts = 0
+
+        self._lock = threading.Condition()
+        self._queues = OrderedDict()  # user -> deque of queued jobs, in round-robin order
+        self._jobs = {}
+        self._in_flight = {}  # content key -> queued or running job
+        self._closed = False
+        self.submitted = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+        self._threads = [threading.Thread(target=self._run, name=f"ocr-job-{i}", daemon=True)
+                         for i in range(concurrency)]
+        for thread in self._threads:
+            thread.start()
+
+    @staticmethod
+    def make_key(data, filename):
+        """
+        Identifies a submission by content, so the same file under any name coalesces.
+        """
+        return content_key(hashlib.sha256(data).hexdigest(), filename)
+
+    def submit(self, user, data, filename=None, key=None):
+        """
+        Queues `data` (file bytes, or a path that stays readable until the job
+        finishes) for extraction on behalf of `user` and returns the job ID.
+        `key` is the make_key value when the caller already hashed the content.
+        Returns the ID of an identical job already in flight if there is one.
+        Raises QueueFull when the queue or the user's share of it is full.
+        """
+        key = key or self.make_key(data, filename)
+        with self._lock:
+            self._expire()
+            job = self._in_flight.get(key)
+            if job is not None:
+                job.users.add(user)
+                self.coalesced += 1
+                return job.id
+
+            waiting = sum(len(q) for q in self._queues.values())
+            if waiting >= self.queue_limit:
+                self.rejected += 1
+                raise QueueFull(f"The server is busy ({waiting} reports waiting). Please try again shortly.")
+            if len(self._queues.get(user, ())) >= self.user_limit:
+                self.rejected += 1
+                raise QueueFull(f"You already have {self.user_limit} reports waiting. "
+                                "Please wait for them to start.")
+
+            job = Job(key, data, filename, user)
+            self._jobs[job.id] = job
+            self._in_flight[key] = job
+            self._queues.setdefault(user, deque()).append(job)
+            self.submitted += 1
+            self._lock.notify()
+            return job.id
+
+    def _next_job(self):
+        # Serve the user at the head of the rotation, then move them to the back
+        user, queue = next(iter(self._queues.items()))
+        job = queue.popleft()
+        del self._queues[user]
+        if queue:
+            self._queues[user] = queue
+        return job
+
+    def _positions(self):
+        """
+        Maps each queued job ID to how many jobs will start before it.
+        """
+        order = itertools.zip_longest(*self._queues.values())
+        jobs = [job for round_ in order for job in round_ if job is not None]
+        return {job.id: i for i, job in enumerate(jobs)}
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._queues and not self._closed:
+                    self._lock.wait()
+                if self._closed:
+                    return
+                job = self._next_job()
+                job.status = RUNNING
+                job.started = time.time()
+                pool = self._pool
+
+            tracing.record("job_wait", job.started - job.submitted)
+            pages = self._extract(job.data, filename=job.filename, executor=pool)
+            try:
+                for page in pages:
+                    if job.cancelled.is_set():
+                        break
+                    with self._lock:
+                        job.pages.append(page)
+                        job.page_count = page.get("page_count") or job.page_count
+                status, error = (CANCELLED if job.cancelled.is_set() else DONE), None
+            except BrokenProcessPool:
+                status, error = FAILED, "An OCR worker crashed while reading this report. Please try again."
+                self._replace_pool(pool)
+            except Exception as e:
+                status, error = FAILED, str(e)
+            finally:
+                pages.close()
+
+            with self._lock:
+                job.status = status
+                job.error = error
+                job.finished = time.time()
+                job.data = None
+                self._in_flight.pop(job.key, None)
+
+    def _replace_pool(self, broken):
+        """
+        Swaps in a fresh process pool after a worker died, unless another job
+        already did. A broken pool refuses all further work, so without this
+        every later job would fail too.
+        """
+        with self._lock:
+            if self._pool is not broken or self._closed:
+                return
+            self._pool = ProcessPoolExecutor(max_workers=self._workers, initializer=init_ocr_worker)
+            self.pool_restarts += 1
+        print(f"OCR worker died; restarted the process pool ({self.pool_restarts} restarts)")
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def status(self, job_id, since=0):
+        """
+        Returns a snapshot of the job: "status", queue "position" (None once
+        started), "pages_done", "page_count", "error", and the "pages" finished
+        after the first `since`. Returns None for unknown or expired jobs.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {
+                "id": job.id,
+                "status": job.status,
+                "position": self._positions().get(job.id) if job.status == QUEUED else None,
+                "pages_done": len(job.pages),
+                "page_count": job.page_count,
+                "pages": job.pages[since:],
+                "error": job.error,
+            }
+
+    def result(self, job_id):
+        """
+        Returns the extracted text of a finished job, else None.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.text if job is not None and job.status == DONE else None
+
+    def cancel(self, job_id, user):
+        """
+        Withdraws `user` from the job; the job itself stops once nobody is waiting for it.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED:
+                return
+            job.users.discard(user)
+            if job.users:
+                return
+            job.cancelled.set()
+            if job.status == QUEUED:
+                queue = self._queues.get(job.user)
+                if queue is not None:
+                    queue.remove(job)
+                    if not queue:
+                        del self._queues[job.user]
+                job.status = CANCELLED
+                job.finished = time.time()
+                job.data = None
+                self._in_flight.pop(job.key, None)
+
+    def _expire(self):
+        cutoff = time.time() - self.retention_s
+        for job_id in [i for i, job in self._jobs.items() if job.finished and job.finished < cutoff]:
+            del self._jobs[job_id]
+
+    def stats(self):
+        """
+        Returns queue depth, running jobs and submission counters.
+        """
+        with self._lock:
+            running = sum(1 for job in self._in_flight.values() if job.status == RUNNING)
+            return {"queued": sum(len(q) for q in self._queues.values()), "running": running,
+                    "users_waiting": len(self._queues), "submitted": self.submitted,
+                    "coalesced": self.coalesced, "rejected": self.rejected,
+                    "pool_restarts": self.pool_restarts}
+
+    def close(self, wait=False):
+        """
+        Stops the dispatchers; `wait` also waits for the OCR processes to exit.
+        """
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+
+def get_default_scheduler():
+    """
+    Returns the process-wide scheduler, starting it on first use.
+    """
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = JobScheduler()
+        return _default_scheduler
@@ -0,0 +1,274 @@
+import re
+
+# Common lab analytes: canonical name -> aliases, usual unit and a broad adult reference
+# range used only when the report itself doesn't print one
+ANALYTES = {
+    "Hemoglobin": (["hemoglobin", "haemoglobin", "hgb", "hb"], "g/dL", (12.0, 17.0)),
+    "RBC Count": (["rbc count", "red blood cell count", "total rbc", "rbc"], "million/cumm", (4.0, 6.0)),
+    "WBC Count": (["total leucocyte count", "total leukocyte count", "wbc count", "tlc", "wbc"], "cells/cumm", (4000, 11000)),
+    "Platelet Count": (["platelet count", "platelets", "plt"], "lakhs/cumm", (1.5, 4.5)),
+    "Hematocrit": (["hematocrit", "haematocrit", "packed cell volume", "pcv", "hct"], "%", (36.0, 50.0)),
+    "MCV": (["mean corpuscular volume", "mcv"], "fL", (80.0, 100.0)),
+    "MCH": (["mean corpuscular hemoglobin", "mch"], "pg", (27.0, 32.0)),
+    "MCHC": (["mchc"], "g/dL", (32.0, 36.0)),
+    "RDW": (["rdw-cv", "rdw"], "%", (11.5, 14.5)),
+    "Neutrophils": (["neutrophils", "neutrophil", "polymorphs"], "%", (40.0, 75.0)),
+    "Lymphocytes": (["lymphocytes", "lymphocyte"], "%", (20.0, 45.0)),
+    "Monocytes": (["monocytes", "monocyte"], "%", (2.0, 10.0)),
+    "Eosinophils": (["eosinophils", "eosinophil"], "%", (1.0, 6.0)),
+    "Basophils": (["basophils", "basophil"], "%", (0.0, 1.0)),
+    "ESR": (["erythrocyte sedimentation rate", "esr"], "mm/hr", (0.0, 20.0)),
+    "Fasting Glucose": (["fasting blood sugar", "fasting blood glucose", "fasting glucose", "fbs"], "mg/dL", (70.0, 100.0)),
+    "Postprandial Glucose": (["post prandial blood sugar", "postprandial glucose", "ppbs"], "mg/dL", (70.0, 140.0)),
+    "Random Glucose": (["random blood sugar", "random glucose", "rbs"], "mg/dL", (70.0, 140.0)),
+    "HbA1c": (["glycated hemoglobin", "hba1c"], "%", (4.0, 5.6)),
+    "Total Cholesterol": (["total cholesterol", "cholesterol"], "mg/dL", (0.0, 200.0)),
+    "HDL Cholesterol": (["hdl cholesterol", "hdl"], "mg/dL", (40.0, 60.0)),
+    "LDL Cholesterol": (["ldl cholesterol", "ldl"], "mg/dL", (0.0, 100.0)),
+    "VLDL Cholesterol": (["vldl cholesterol", "vldl"], "mg/dL", (5.0, 40.0)),
+    "Triglycerides": (["triglycerides", "triglyceride"], "mg/dL", (0.0, 150.0)),
+    "Creatinine": (["serum creatinine", "creatinine"], "mg/dL", (0.6, 1.3)),
+    "Urea": (["blood urea", "urea"], "mg/dL", (15.0, 45.0)),
+    "BUN": (["blood urea nitrogen", "bun"], "mg/dL", (7.0, 20.0)),
+    "Uric Acid": (["uric acid"], "mg/dL", (3.5, 7.2)),
+    "Sodium": (["sodium", "na+"], "mmol/L", (135.0, 145.0)),
+    "Potassium": (["potassium", "k+"], "mmol/L", (3.5, 5.1)),
+    "Chloride": (["chloride", "cl-"], "mmol/L", (98.0, 107.0)),
+    "Calcium": (["serum calcium", "calcium"], "mg/dL", (8.5, 10.5)),
+    "Total Bilirubin": (["total bilirubin", "bilirubin total", "bilirubin"], "mg/dL", (0.2, 1.2)),
+    "Direct Bilirubin": (["direct bilirubin", "bilirubin direct", "conjugated bilirubin"], "mg/dL", (0.0, 0.3)),
+    "AST (SGOT)": (["sgot", "ast", "aspartate aminotransferase"], "U/L", (0.0, 40.0)),
+    "ALT (SGPT)": (["sgpt", "alt", "alanine aminotransferase"], "U/L", (0.0, 41.0)),
+    "Alkaline Phosphatase": (["alkaline phosphatase", "alp"], "U/L", (40.0, 130.0)),
+    "Total Protein": (["total protein", "total proteins"], "g/dL", (6.0, 8.3)),
+    "Albumin": (["albumin"], "g/dL", (3.5, 5.2)),
+    "Globulin": (["globulin"], "g/dL", (2.0, 3.5)),
+    "TSH": (["thyroid stimulating hormone", "tsh"], "uIU/mL", (0.4, 4.5)),
+    "T3": (["total t3", "triiodothyronine", "t3"], "ng/dL", (80.0, 200.0)),
+    "T4": (["total t4", "thyroxine", "t4"], "ug/dL", (5.0, 12.0)),
+    "Vitamin D": (["25-oh vitamin d", "vitamin d3", "vitamin d"], "ng/mL", (30.0, 100.0)),
+    "Vitamin B12": (["vitamin b12", "cobalamin"], "pg/mL", (200.0, 900.0)),
+    "Iron": (["serum iron", "iron"], "ug/dL", (60.0, 170.0)),
+    "Ferritin": (["serum ferritin", "ferritin"], "ng/mL", (20.0, 300.0)),
+}
+
+# Canonical unit -> spellings seen on reports
+UNITS = {
+    "g/dL": ["g/dl", "gm/dl", "gms/dl", "gm%"],
+    "mg/dL": ["mg/dl", "mg%"],
+    "ug/dL": ["ug/dl", "mcg/dl"],
+    "ng/dL": ["ng/dl"],
+    "ng/mL": ["ng/ml"],
+    "pg/mL": ["pg/ml"],
+    "uIU/mL": ["uiu/ml", "miu/l", "miu/ml"],
+    "mmol/L": ["mmol/l"],
+    "mEq/L": ["meq/l"],
+    "U/L": ["iu/l", "u/l"],
+    "million/cumm": ["million/cumm", "mill/cumm", "millions/cumm", "10^6/ul", "x10^6/ul"],
+    "lakhs/cumm": ["lakhs/cumm", "lakh/cumm", "lakhs/cmm"],
+    "cells/cumm": ["cells/cumm", "/cumm", "cells/ul", "/ul"],
+    "10^3/uL": ["10^3/ul", "x10^3/ul", "thou/ul", "k/ul"],
+    "mm/hr": ["mm/1st hr", "mm/hr", "mm/h"],
+    "fL": ["fl"],
+    "pg": ["pg"],
+    "%": ["%"],
+}
+
+# clean_ocr_output turns "l" into "1" and "O" into "0", so match either
+_OCR_FOLD = {"l": "[l1]", "o": "[o0]"}
+
+
+def _fold_pattern(phrase):
+    """
+    Turns a lowercase phrase into a regex tolerant to OCR digit/letter swaps and spacing.
+    """
+    parts = []
+    for ch in phrase:
+        if ch in _OCR_FOLD:
+            parts.append(_OCR_FOLD[ch])
+        elif ch == " ":
+            parts.append(r"[\s.]*")
+        else:
+            parts.append(re.escape(ch))
+    return "".join(parts)
+
+
+def _alternation(phrases):
+    # Longest first so "total bilirubin" wins over "bilirubin"
+    return "|".join(_fold_pattern(p) for p in sorted(phrases, key=len, reverse=True))
+
+
+_ALIAS_TO_ANALYTE = {}
+for _name, (_aliases, _, _) in ANALYTES.items():
+    for _alias in _aliases:
+        _ALIAS_TO_ANALYTE[_alias] = _name
+
+_ANALYTE_RE = re.compile(r"(?<![a-z0-9])(" + _alternation(_ALIAS_TO_ANALYTE) + r")(?![a-z0-9])", re.IGNORECASE)
+_ALIAS_RES = [(re.compile(_fold_pattern(alias) + r"$", re.IGNORECASE), name)
+              for alias, name in sorted(_ALIAS_TO_ANALYTE.items(), key=lambda item: -len(item[0]))]
+
+_UNIT_RES = [(re.compile(_fold_pattern(spelling) + r"$", re.IGNORECASE), unit)
+             for unit, spellings in UNITS.items() for spelling in spellings]
+_UNIT_PATTERN = r"(?:" + _alternation([s for spellings in UNITS.values() for s in spellings]) + r")(?![a-z])"
+_UNIT_RE = re.compile(_UNIT_PATTERN, re.IGNORECASE)
+_LEADING_UNIT_RE = re.compile(r"\s*(" + _UNIT_PATTERN + r")", re.IGNORECASE)
+
+# Thousands may be grouped with commas ("8,500"), which clean_ocr_output turns into dots
+_NUMBER = r"\d{1,3}(?:,\d{3})+(?![\d,])|\d+(?:\.\d+)?"
+_GROUPED_RE = re.compile(r"\d{1,3}(?:[.,]\d{3})+$")
+# A number glued to a hyphenated qualifier ("25-Hydroxy", "25-OH", or "25-0H" after
+# OCR cleanup) is part of the name
+_VALUE_RE = re.compile(r"(?<![\w.^])(?<!\w-)(" + _NUMBER + r")(?![\d^])(?!-[a-z0-9]*[a-z])", re.IGNORECASE)
+# Dates ("12/05/2024", "12-05-24") and times are never results
+_DATE_RE = re.compile(r"(?<!\d)\d{1,4}([/.-])\d{1,2}\1\d{2,4}(?!\d)|(?<!\d)\d{1,2}:\d{2}(?::\d{2})?(?!\d)")
+# "Non-HDL", "LDL/HDL Ratio": an alias inside these names a different test
+_NEGATED_RE = re.compile(r"non[\s-]*$", re.IGNORECASE)
+_RATIO_RE = re.compile(r"(?<![a-z])ratio(?![a-z])", re.IGNORECASE)
+_RANGE_RE = re.compile(r"(" + _NUMBER + r")\s*(?:-|to)\s*(" + _NUMBER + r")", re.IGNORECASE)
+_LIMIT_RE = re.compile(r"([<>])\s*=?\s*(" + _NUMBER + r")")
+_FLAG_RE = re.compile(r"(?<![a-z])(high|low|h|l)(?![a-z])|\*", re.IGNORECASE)
+
+
+def _canonical(matched, compiled):
+    for pattern, canonical in compiled:
+        if pattern.match(matched.strip()):
+            return canonical
+    return None
+
+
+def _number(text, name):
+    """
+    Converts a matched number for analyte `name`. "8.500" is a grouped 8500 for
+    tests counted in thousands (WBC), and a decimal for everything else.
+    """
+    if "," in text or (_GROUPED_RE.match(text) and ANALYTES[name][2][1] >= 1000):
+        return float(text.replace(",", "").replace(".", ""))
+    return float(text)
+
+
+def parse_line(line):
+    """
+    Parses one report line into a lab record, or returns None if it holds no known analyte with a value.
+    """
+    m_name = _ANALYTE_RE.search(line)
+    if not m_name or _RATIO_RE.search(line) or line[m_name.end():m_name.end() + 1] == "/":
+        return None
+    if _NEGATED_RE.search(line[:m_name.start()]):
+        return None
+    name = _canonical(m_name.group(1), _ALIAS_RES)
+    rest = _DATE_RE.sub(lambda m: " " * len(m.group(0)), line[m_name.end():])
+
+    m_value = _VALUE_RE.search(rest)
+    if not m_value:
+        return None
+    value = _number(m_value.group(1), name)
+    after = rest[m_value.end():]
+
+    # Unit usually follows the value; some layouts put it in the last column instead
+    unit = None
+    m_unit = _LEADING_UNIT_RE.match(after)
+    if m_unit:
+        unit = _canonical(m_unit.group(1), _UNIT_RES)
+        after = after[m_unit.end():]
+    else:
+        m_unit = _UNIT_RE.search(after)
+        if m_unit:
+            unit = _canonical(m_unit.group(0), _UNIT_RES)
+            after = after[:m_unit.start()] + " " + after[m_unit.end():]
+
+    low = high = None
+    range_source = "report"
+    m_range = _RANGE_RE.search(after)
+    m_limit = _LIMIT_RE.search(after)
+    if m_range:
+        low, high = _number(m_range.group(1), name), _number(m_range.group(2), name)
+    elif m_limit:
+        if m_limit.group(1) == "<":
+            high = _number(m_limit.group(2), name)
+        else:
+            low = _number(m_limit.group(2), name)
+    else:
+        _, _, (low, high) = ANALYTES[name]
+        range_source = "default"
+
+    default_unit = ANALYTES[name][1]
+    if range_source == "default" and unit and unit != default_unit:
+        # The built-in range is only meaningful in the analyte's usual unit
+        low = high = None
+        range_source = None
+
+    if low is not None and value < low:
+        flag = "L"
+    elif high is not None and value > high:
+        flag = "H"
+    elif low is not None or high is not None:
+        flag = "N"
+    else:
+        m_flag = _FLAG_RE.search(after)
+        flag = m_flag.group(0)[0].upper() if m_flag and m_flag.group(0) != "*" else None
+
+    return {
+        "test": name,
+        "value": value,
+        "unit": unit or default_unit,
+        "reference_range": _format_range(low, high),
+        "range_source": range_source,
+        "flag": flag,
+    }
+
+
+def _format_range(low, high):
+    if low is not None and high is not None:
+        return f"{low:g}-{high:g}"
+    if high is not None:
+        return f"<{high:g}"
+    if low is not None:
+        return f">{low:g}"
+    return None
+
+
+def table_lines(tables):
+    """
+    Yields one line per row of Camelot tables (anything with a `.df` DataFrame).
+    """
+    for table in tables:
+        for row in table.df.itertuples(index=False):
+            yield " ".join(str(cell).strip() for cell in row if str(cell).strip())
+
+
+def extract_lab_values(text, tables=None):
+    """
+    Extracts structured lab records (test, value, unit, reference range, flag) from
+    extracted report text and, optionally, Camelot tables. No LLM involved.
+    """
+    lines = list(table_lines(tables)) if tables else []
+    lines.extend(text.splitlines())
+
+    records = []
+    seen = set()
+    for line in lines:
+        record = parse_line(line)
+        if record is None:
+            continue
+        key = (record["test"], record["value"])
+        if key in seen:
+            continue
+        seen.add(key)
+        records.append(record)
+    return records
+
+
+def format_records(records):
+    """
+    Serializes records compactly for an LLM prompt, one test per line.
+    """
+    flags = {"H": "HIGH", "L": "LOW", "N": "normal"}
+    lines = []
+    for r in records:
+        line = f"{r['test']}: {r['value']:g} {r['unit']}"
+        if r["reference_range"]:
+            line += f" (ref {r['reference_range']}{', typical' if r['range_source'] == 'default' else ''})"
+        if r["flag"]:
+            line += f" {flags.get(r['flag'], r['flag'])}"
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,67 @@
+import importlib
+import threading
+import time
+import types
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stands in for a module until one of its attributes is first used, then imports
+    the real module and forwards to it. Keeps `import trial` from paying for Camelot,
+    OpenCV and the PDF stack on code paths that never touch them.
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+        self.__dict__["_lock"] = threading.Lock()
+
+    def load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            with self.__dict__["_lock"]:
+                module = self.__dict__["_module"]
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    self.__dict__["_module"] = module
+        return module
+
+    @property
+    def loaded(self):
+        return self.__dict__["_module"] is not None
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self.load(), attr, value)
+
+    def __dir__(self):
+        return dir(self.load())
+
+    def __repr__(self):
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+
+_lazy_modules = {}
+
+
+def lazy_module(name):
+    """
+    Returns a LazyModule for `name`, shared by every module that asks for it.
+    """
+    return _lazy_modules.setdefault(name, LazyModule(name))
+
+
+def prewarm(names=None):
+    """
+    Imports the given lazy modules (all of them by default) now, so the first
+    request doesn't pay for it. Returns {module name: seconds taken}.
+    """
+    timings = {}
+    for name in names or list(_lazy_modules):
+        start = time.perf_counter()
+        lazy_module(name).load()
+        timings[name] = round(time.perf_counter() - start, 3)
+    return timings
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Where LLM answers are stored, how long they stay valid and how much disk they may use
+DEFAULT_CACHE_PATH = os.environ.get(
+    "MEDIBOT_LLM_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "medibot", "llm.sqlite3")
+)
+DEFAULT_TTL_HOURS = float(os.environ.get("MEDIBOT_LLM_CACHE_TTL_HOURS", "168"))
+DEFAULT_MAX_MB = int(os.environ.get("MEDIBOT_LLM_CACHE_MB", "64"))
+
+
+def normalize_text(text):
+    """
+    Folds case and whitespace so re-scans of the same report map to the same key.
+    """
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+class LLMCache:
+    """
+    SQLite-backed cache of LLM responses. Entries expire after `ttl_seconds` and the
+    least recently used ones are evicted when the stored text exceeds `max_bytes`.
+    Provider agnostic: `get_or_call` takes any callable that returns the response text.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=DEFAULT_TTL_HOURS * 3600,
+                 max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    model TEXT,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    latency_s REAL NOT NULL,
+                    size INTEGER NOT NULL
+                )""")
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.latency_saved_s = 0.0
+
+    @staticmethod
+    def make_key(text, template_version, analysis_type, model):
+        """
+        Builds the cache key from the normalized report text and everything that shapes the answer.
+        """
+        parts = [normalize_text(text), str(template_version), analysis_type, model]
+        return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+    def get(self, key):
+        """
+        Returns the cached response for `key`, or None on a miss or expired entry.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT response, created, latency_s FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            self.latency_saved_s += row[2]
+            return row[0]
+
+    def put(self, key, response, model=None, latency_s=0.0):
+        """
+        Stores a response together with how long it took to generate, then trims the cache.
+        """
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, response, model, now, now, latency_s, size),
+            )
+            self._evict(now)
+
+    def get_or_call(self, key, call, model=None):
+        """
+        Returns (response, cached). On a miss `call()` produces the response, which is stored.
+        """
+        response = self.get(key)
+        if response is not None:
+            return response, True
+        start = time.perf_counter()
+        response = call()
+        self.put(key, response, model=model, latency_s=time.perf_counter() - start)
+        return response, False
+
+    def _evict(self, now):
+        cursor = self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        self.evictions += cursor.rowcount
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until we are back under 90% of the budget
+        target = self.max_bytes * 0.9
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            if total <= target:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Deletes every stored response.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+
+    def stats(self):
+        """
+        Returns hit/miss counters, the generation time saved by hits and the stored size.
+        """
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "latency_saved_s": round(self.latency_saved_s, 3),
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": size,
+            }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """
+    Returns the process-wide LLM response cache shared by the Streamlit and Tk front ends.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LLMCache()
+        return _default_cache
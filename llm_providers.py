@@ -0,0 +1,330 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import tracing
+
+# API endpoints; point both at fake_llm_server.py to run without network or keys
+GEMINI_BASE_URL = os.environ.get("MEDIBOT_GEMINI_URL", "https://generativelanguage.googleapis.com")
+GROQ_BASE_URL = os.environ.get("MEDIBOT_GROQ_URL", "https://api.groq.com/openai/v1")
+
+# Deadline for a whole call including retries, retries per call, seconds before a
+# hedge request is sent (0 disables hedging) and concurrent requests per provider
+DEFAULT_TIMEOUT = float(os.environ.get("MEDIBOT_LLM_TIMEOUT", "60"))
+DEFAULT_RETRIES = int(os.environ.get("MEDIBOT_LLM_RETRIES", "2"))
+DEFAULT_HEDGE_AFTER = float(os.environ.get("MEDIBOT_LLM_HEDGE_AFTER", "0"))
+DEFAULT_CONCURRENCY = int(os.environ.get("MEDIBOT_LLM_CONCURRENCY", "4"))
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+CONNECT_TIMEOUT = 5.0
+
+# Runs hedged attempts; the slower duplicate finishes in the background and is dropped
+_hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+
+
+class LLMError(Exception):
+    """
+    Raised when a provider call fails. `retryable` marks transient failures
+    (timeouts, connection errors, 429 and 5xx responses).
+    """
+
+    def __init__(self, message, status=None, retryable=False):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+
+
+class Provider:
+    """
+    Base class for chat-style LLM APIs. Holds a pooled requests.Session, bounds
+    concurrent requests and wraps every call in a deadline, retries with
+    exponential backoff and full jitter, and optional hedging.
+    Subclasses build the request (`_request`) and parse responses (`_parse`).
+    """
+
+    name = None
+
+    def __init__(self, api_key, model, base_url, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 hedge_after=DEFAULT_HEDGE_AFTER, max_concurrency=DEFAULT_CONCURRENCY,
+                 backoff=0.5, max_backoff=8.0):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.hedge_after = hedge_after
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        # Keep-alive connections, sized for the concurrency limit plus hedges
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency * 2, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.retried = 0
+        self.hedged = 0
+        self.failures = 0
+
+    def _request(self, prompt, stream):
+        """
+        Returns (url, headers, JSON payload) for one request.
+        """
+        raise NotImplementedError
+
+    def _parse(self, data):
+        """
+        Returns (text, prompt tokens, output tokens) from a response or stream chunk.
+        """
+        raise NotImplementedError
+
+    def _count(self, **increments):
+        with self._stats_lock:
+            for name, value in increments.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def _post(self, prompt, deadline, stream=False):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LLMError(f"{self.name} call exceeded its deadline.")
+        url, headers, payload = self._request(prompt, stream)
+        try:
+            response = self.session.post(url, headers=headers, json=payload, stream=stream,
+                                         timeout=(min(CONNECT_TIMEOUT, remaining), remaining))
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise LLMError(f"{self.name} request failed: {e}", retryable=True) from e
+
+        if response.status_code != 200:
+            try:
+                message = response.json()["error"]["message"]
+            except (ValueError, KeyError, TypeError):
+                message = response.text[:200]
+            response.close()
+            raise LLMError(f"{self.name} returned {response.status_code}: {message}",
+                           status=response.status_code,
+                           retryable=response.status_code in RETRYABLE_STATUS)
+        return response
+
+    def _acquire(self, deadline):
+        if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            raise LLMError(f"Timed out waiting for a free {self.name} request slot.")
+
+    def _call_once(self, prompt, deadline):
+        self._acquire(deadline)
+        try:
+            response = self._post(prompt, deadline)
+            try:
+                return self._parse(response.json())
+            except ValueError as e:
+                raise LLMError(f"{self.name} sent invalid JSON: {e}", retryable=True) from e
+        finally:
+            self._slots.release()
+
+    def _hedged(self, fn, deadline):
+        """
+        Runs `fn`; if it has not finished after `hedge_after` seconds, starts a
+        duplicate and returns whichever succeeds first.
+        """
+        if self.hedge_after <= 0:
+            return fn()
+        first = _hedge_pool.submit(fn)
+        done, _ = wait([first], timeout=self.hedge_after)
+        if done:
+            return first.result()
+
+        self._count(hedged=1)
+        pending = {first, _hedge_pool.submit(fn)}
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                raise LLMError(f"{self.name} call exceeded its deadline.")
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _with_retries(self, fn, deadline):
+        """
+        Calls `fn` until it succeeds, a non-retryable error occurs, retries run
+        out or the next backoff would pass the deadline. Returns (result, attempts).
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                return fn(), attempt + 1
+            except LLMError as e:
+                if not e.retryable or attempt == self.retries:
+                    raise
+                # Full jitter keeps clients that failed together from retrying together
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                if time.monotonic() + delay >= deadline:
+                    raise
+                self._count(retried=1)
+                time.sleep(delay)
+
+    def generate(self, prompt, timeout=None):
+        """
+        Returns {"text", "prompt_tokens", "output_tokens", "attempts"} for `prompt`.
+        Raises LLMError once retries or the deadline (`timeout` seconds) run out.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self._count(calls=1)
+        with tracing.span("llm", provider=self.name, model=self.model) as span:
+            try:
+                (text, prompt_tokens, output_tokens), attempts = self._with_retries(
+                    lambda: self._hedged(lambda: self._call_once(prompt, deadline), deadline), deadline)
+            except LLMError:
+                self._count(failures=1)
+                raise
+            span.set(attempts=attempts, prompt_tokens=prompt_tokens, output_tokens=output_tokens)
+        return {"text": text, "prompt_tokens": prompt_tokens,
+                "output_tokens": output_tokens, "attempts": attempts}
+
+    def stream(self, prompt, timeout=None):
+        """
+        Yields the response text chunk by chunk as the provider generates it.
+        Connecting is retried; once text has been yielded a failure is raised as is.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self._count(calls=1)
+        with tracing.span("llm", provider=self.name, model=self.model, stream=True) as span:
+            start = time.perf_counter()
+            self._acquire(deadline)
+            try:
+                try:
+                    response, attempts = self._with_retries(
+                        lambda: self._post(prompt, deadline, stream=True), deadline)
+                except LLMError:
+                    self._count(failures=1)
+                    raise
+                span.set(attempts=attempts)
+                with response:
+                    first_chunk_s = None
+                    for line in response.iter_lines(decode_unicode=True):
+                        # Server-sent events: "data: {json}", ended by "data: [DONE]" on Groq
+                        if not line or not line.startswith("data:"):
+                            continue
+                        payload = line[5:].strip()
+                        if payload == "[DONE]":
+                            break
+                        text, prompt_tokens, output_tokens = self._parse(json.loads(payload))
+                        if output_tokens is not None:
+                            span.set(prompt_tokens=prompt_tokens, output_tokens=output_tokens)
+                        if text:
+                            if first_chunk_s is None:
+                                first_chunk_s = time.perf_counter() - start
+                                span.set(first_chunk_s=round(first_chunk_s, 4))
+                            yield text
+            finally:
+                self._slots.release()
+
+    async def agenerate(self, prompt, timeout=None):
+        """
+        Async form of `generate`; the blocking call runs in a worker thread.
+        """
+        return await asyncio.to_thread(self.generate, prompt, timeout)
+
+    async def astream(self, prompt, timeout=None):
+        """
+        Async form of `stream`.
+        """
+        chunks = self.stream(prompt, timeout)
+        done = object()
+        while True:
+            text = await asyncio.to_thread(next, chunks, done)
+            if text is done:
+                break
+            yield text
+
+    def stats(self):
+        """
+        Returns call, retry, hedge and failure counters.
+        """
+        with self._stats_lock:
+            return {"calls": self.calls, "retried": self.retried,
+                    "hedged": self.hedged, "failures": self.failures}
+
+    def close(self):
+        self.session.close()
+
+
+class GeminiProvider(Provider):
+    """
+    Google Gemini through the generateContent REST API.
+    """
+
+    name = "gemini"
+
+    def __init__(self, api_key, model="gemini-2.5-flash", base_url=GEMINI_BASE_URL, **kwargs):
+        super().__init__(api_key, model, base_url, **kwargs)
+
+    def _request(self, prompt, stream):
+        method = "streamGenerateContent?alt=sse" if stream else "generateContent"
+        return (f"{self.base_url}/v1beta/models/{self.model}:{method}",
+                {"x-goog-api-key": self.api_key, "Content-Type": "application/json"},
+                {"contents": [{"role": "user", "parts": [{"text": prompt}]}]})
+
+    def _parse(self, data):
+        candidates = data.get("candidates") or [{}]
+        parts = (candidates[0].get("content") or {}).get("parts") or []
+        usage = data.get("usageMetadata") or {}
+        return ("".join(part.get("text", "") for part in parts),
+                usage.get("promptTokenCount"), usage.get("candidatesTokenCount"))
+
+
+class GroqProvider(Provider):
+    """
+    Groq through its OpenAI-compatible chat completions API.
+    """
+
+    name = "groq"
+
+    def __init__(self, api_key, model="llama-3.3-70b-versatile", base_url=GROQ_BASE_URL, **kwargs):
+        super().__init__(api_key, model, base_url, **kwargs)
+
+    def _request(self, prompt, stream):
+        payload = {"model": self.model, "messages": [{"role": "user", "content": prompt}]}
+        if stream:
+            payload["stream"] = True
+        return (f"{self.base_url}/chat/completions",
+                {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"},
+                payload)
+
+    def _parse(self, data):
+        choice = (data.get("choices") or [{}])[0]
+        message = choice.get("message") or choice.get("delta") or {}
+        # Streamed responses carry usage in the last chunk under x_groq
+        usage = data.get("usage") or (data.get("x_groq") or {}).get("usage") or {}
+        return message.get("content") or "", usage.get("prompt_tokens"), usage.get("completion_tokens")
+
+
+PROVIDERS = {"gemini": GeminiProvider, "groq": GroqProvider}
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_provider(name, api_key, model=None, **kwargs):
+    """
+    Returns the process-wide provider for (name, api_key, model), creating it on
+    first use so its connection pool and concurrency limit are shared.
+    """
+    key = (name, api_key, model)
+    with _providers_lock:
+        if key not in _providers:
+            if model is not None:
+                kwargs["model"] = model
+            _providers[key] = PROVIDERS[name](api_key, **kwargs)
+        return _providers[key]
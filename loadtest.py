@@ -0,0 +1,250 @@
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import llm_providers
+import prompt_builder
+import tracing
+import trial
+from bench_corpus import build_corpus
+from fake_llm_server import FakeLLMServer
+from job_queue import (DONE, FINISHED, JOB_CONCURRENCY, JOB_QUEUE_LIMIT, JOB_USER_LIMIT, JOB_WORKERS, JobScheduler,
+                       QueueFull)
+from lab_values import extract_lab_values
+
+VALUES_ONLY = "Value Extraction Only"
+JOB_POLL_S = 0.02
+
+
+def percentile(values, q):
+    """
+    Nearest-rank percentile of `values` (q in 0-100), or None if there are none.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def latency_summary(values):
+    return {
+        "p50_s": _round(percentile(values, 50)),
+        "p95_s": _round(percentile(values, 95)),
+        "p99_s": _round(percentile(values, 99)),
+        "max_s": _round(max(values) if values else None),
+    }
+
+
+def _round(value, digits=4):
+    return round(value, digits) if value is not None else None
+
+
+def run_request(number, doc, data, scheduler, provider, analysis_type, users, arrival, coalesce):
+    """
+    One report through the app's flow: queued OCR, local lab values, prompt build
+    and streamed analysis (the LLM answer cache is bypassed). Latencies are measured
+    from the scheduled `arrival`, so time spent waiting for a free client slot counts too.
+    """
+    result = {"doc": doc["name"], "pages": doc["pages"], "error": None, "first_chunk_s": None}
+    with tracing.span("request", doc=doc["name"]) as span:
+        try:
+            # Unless coalescing is wanted, a unique key makes every request real work
+            job_id = scheduler.submit(f"user{number % users}", data, os.path.basename(doc["path"]),
+                                      key=None if coalesce else f"loadtest-{number}")
+        except QueueFull:
+            result["error"] = "rejected"
+        else:
+            while True:
+                job = scheduler.status(job_id)
+                if job["status"] in FINISHED:
+                    break
+                time.sleep(JOB_POLL_S)
+            if job["status"] != DONE:
+                result["error"] = "extract"
+            else:
+                page_texts = [page["text"] for page in job["pages"]]
+                with tracing.span("lab_values"):
+                    records = extract_lab_values("".join(page_texts))
+                if analysis_type != VALUES_ONLY:
+                    try:
+                        prompt, _ = prompt_builder.build_prompt(prompt_builder.ANALYSIS_INSTRUCTIONS[analysis_type],
+                                                                prompt_builder.report_pages(page_texts, records),
+                                                                provider=provider, raw_pages=page_texts)
+                        for _ in provider.stream(prompt):
+                            if result["first_chunk_s"] is None:
+                                result["first_chunk_s"] = time.perf_counter() - arrival
+                    except llm_providers.LLMError:
+                        result["error"] = "llm"
+        span.set(error=result["error"])
+    result["latency_s"] = time.perf_counter() - arrival
+    return result
+
+
+def stage_report(sampler):
+    """
+    Per-stage span count, latency percentiles, total CPU and peak memory.
+    """
+    durations = defaultdict(list)
+    for span in list(tracing.collector.recent):
+        durations[span.name].append(span.duration)
+    stages = {}
+    for name, values in sorted(durations.items()):
+        stages[name] = dict(
+            latency_summary(values),
+            count=len(values),
+            total_s=round(sum(values), 4),
+            cpu_s=round(tracing.collector.counters.get((name, "cpu_s"), 0.0), 4),
+            peak_rss_mb=round(sampler.stage_peak_mb[name], 1) if name in sampler.stage_peak_mb else None,
+        )
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the extraction and analysis flow against a fake LLM.")
+    parser.add_argument("--corpus-dir", default="bench_corpus")
+    parser.add_argument("--pages", default="1,5", help="page counts of generated PDFs")
+    parser.add_argument("--noise", default="0,1", help="noise levels of generated scans")
+    parser.add_argument("--only", help="only use documents whose name contains this")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--requests", type=int, default=50, help="total reports to submit")
+    parser.add_argument("--concurrency", type=int, default=8, help="reports in flight at most (client sessions)")
+    parser.add_argument("--rate", type=float, default=0.0,
+                        help="arrivals per second (Poisson); 0 submits everything at once")
+    parser.add_argument("--users", type=int, default=4, help="distinct users the requests are spread over")
+    parser.add_argument("--analysis-type", default="Quick Summary",
+                        choices=list(prompt_builder.ANALYSIS_INSTRUCTIONS) + [VALUES_ONLY])
+    parser.add_argument("--ocr-cache", action="store_true", help="allow OCR cache hits (off: every report is OCR'd)")
+    parser.add_argument("--coalesce", action="store_true", help="let concurrent uploads of one document share a job")
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS, help="OCR processes")
+    parser.add_argument("--job-concurrency", type=int, default=JOB_CONCURRENCY, help="reports extracted at once")
+    parser.add_argument("--queue-limit", type=int, default=JOB_QUEUE_LIMIT)
+    parser.add_argument("--user-limit", type=int, default=JOB_USER_LIMIT)
+    parser.add_argument("--provider", default="gemini", choices=list(llm_providers.PROVIDERS))
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds the fake LLM takes per response")
+    parser.add_argument("--llm-jitter", type=float, default=0.5, help="extra random LLM latency, up to this many seconds")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="fraction of LLM requests answered with 503")
+    parser.add_argument("--chunk-delay", type=float, default=0.02, help="seconds between streamed chunks")
+    parser.add_argument("--output", default="loadtest_results.json")
+    parser.add_argument("--max-p95", type=float, help="exit non-zero if p95 latency exceeds this many seconds")
+    parser.add_argument("--max-error-rate", type=float, help="exit non-zero if the error rate exceeds this fraction")
+    args = parser.parse_args()
+
+    docs = build_corpus(args.corpus_dir,
+                        page_counts=[int(p) for p in args.pages.split(",")],
+                        noise_levels=[int(n) for n in args.noise.split(",")],
+                        seed=args.seed)
+    if args.only:
+        docs = [d for d in docs if args.only in d["name"]]
+    if not docs:
+        sys.exit("No documents match.")
+    contents = {}
+    for doc in docs:
+        with open(doc["path"], "rb") as f:
+            contents[doc["name"]] = f.read()
+
+    tracing.enabled = True
+    # Keep every span of the run for percentiles, not just the most recent 10000
+    tracing.collector = tracing.Collector(max_spans=max(10000, args.requests * 100))
+    trial.prewarm()
+
+    fake = FakeLLMServer(latency=args.llm_latency, jitter=args.llm_jitter, error_rate=args.llm_error_rate,
+                         chunk_delay=args.chunk_delay, seed=args.seed).start()
+    base_url = fake.gemini_url if args.provider == "gemini" else fake.groq_url
+    provider = llm_providers.PROVIDERS[args.provider]("fake-key", base_url=base_url)
+    extract = partial(trial.iter_extract_text, cache=args.ocr_cache)
+    scheduler = JobScheduler(workers=args.workers, concurrency=args.job_concurrency, queue_limit=args.queue_limit,
+                             user_limit=args.user_limit, extract=extract)
+    sampler = tracing.MemorySampler()
+    sampler.start()
+
+    print(f"Load test: {args.requests} requests over {len(docs)} documents, concurrency {args.concurrency}, "
+          f"{'rate ' + str(args.rate) + '/s' if args.rate else 'all at once'}, "
+          f"{args.workers} OCR processes, fake {args.provider} at {fake.url}")
+    rng = random.Random(args.seed)
+    cpu_start = os.times()
+    start = time.perf_counter()
+    futures = []
+    with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="client") as clients:
+        arrival = start
+        for number in range(args.requests):
+            if args.rate:
+                arrival += rng.expovariate(args.rate)
+                time.sleep(max(0.0, arrival - time.perf_counter()))
+            doc = docs[number % len(docs)]
+            futures.append(clients.submit(run_request, number, doc, contents[doc["name"]], scheduler, provider,
+                                          args.analysis_type, args.users, arrival, args.coalesce))
+        results = [future.result() for future in futures]
+    wall_s = time.perf_counter() - start
+
+    scheduler.close(wait=True)  # OCR processes' CPU is only counted once they exit
+    sampler.stop()
+    cpu_end = os.times()
+    provider.close()
+    fake.stop()
+
+    ok = [r for r in results if r["error"] is None]
+    errors = Counter(r["error"] for r in results if r["error"] is not None)
+    cpu_s = (cpu_end.user - cpu_start.user) + (cpu_end.system - cpu_start.system)
+    children_cpu_s = ((cpu_end.children_user - cpu_start.children_user)
+                      + (cpu_end.children_system - cpu_start.children_system))
+    summary = {
+        "requests": len(results),
+        "ok": len(ok),
+        "errors": dict(errors),
+        "error_rate": round(1 - len(ok) / len(results), 4) if results else None,
+        "wall_s": round(wall_s, 3),
+        "throughput_rps": round(len(ok) / wall_s, 3),
+        "pages_per_s": round(sum(r["pages"] for r in ok) / wall_s, 3),
+        "latency": latency_summary([r["latency_s"] for r in ok]),
+        "first_chunk": latency_summary([r["first_chunk_s"] for r in ok if r["first_chunk_s"] is not None]),
+        "cpu_s": round(cpu_s, 3),
+        "children_cpu_s": round(children_cpu_s, 3),
+        "cpu_utilization": round((cpu_s + children_cpu_s) / wall_s / (os.cpu_count() or 1), 3),
+        "peak_rss_mb": _round(sampler.peak_mb, 1),
+        "peak_workers_rss_mb": _round(sampler.peak_workers_mb, 1),
+        "llm": dict(provider.stats(), server_requests=fake.requests, server_errors=fake.errors),
+        "jobs": scheduler.stats(),
+    }
+    output = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": vars(args),
+        "summary": summary,
+        "stages": stage_report(sampler),
+    }
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+
+    latency = summary["latency"]
+    print(f"\n{summary['ok']}/{summary['requests']} ok, errors {summary['errors'] or 'none'}, "
+          f"{summary['throughput_rps']} req/s, {summary['pages_per_s']} pages/s")
+    print(f"latency p50 {latency['p50_s']}s  p95 {latency['p95_s']}s  p99 {latency['p99_s']}s  max {latency['max_s']}s")
+    print(f"CPU {summary['cpu_s']}s + {summary['children_cpu_s']}s in OCR processes "
+          f"({summary['cpu_utilization']:.0%} of {os.cpu_count()} cores), peak RSS {summary['peak_rss_mb']} MB "
+          f"+ {summary['peak_workers_rss_mb']} MB in workers")
+    print(f"\n  {'stage':<14}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'cpu':>9}{'peak MB':>9}")
+    for name, stage in output["stages"].items():
+        print(f"  {name:<14}{stage['count']:>7}{stage['p50_s']:>9.3f}{stage['p95_s']:>9.3f}{stage['p99_s']:>9.3f}"
+              f"{stage['cpu_s']:>9.2f}{stage['peak_rss_mb'] if stage['peak_rss_mb'] is not None else '-':>9}")
+    print(f"\nResults written to {args.output}")
+
+    failed = False
+    if args.max_p95 is not None and (latency["p95_s"] is None or latency["p95_s"] > args.max_p95):
+        print(f"p95 latency {latency['p95_s']}s is over the {args.max_p95}s limit")
+        failed = True
+    if args.max_error_rate is not None and summary["error_rate"] > args.max_error_rate:
+        print(f"error rate {summary['error_rate']} is over the {args.max_error_rate} limit")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,21 @@ from tkinter import ttk, filedialog, messagebox
 from PIL import Image, ImageTk
 import cv2
 import pytesseract
+import ocr_engine
+import llm_cache
+import llm_providers
+import medicine_index
+import doctor_store
+from doctor_store import SpecialtyMatcher
+from medicine_index import format_medicine
 import re
-import requests
 import webbrowser
 import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from groq import Groq
 
 # ---------------- API CONFIG ----------------
@@ -21,37 +32,51 @@ if not api_key:
 
 client = Groq(api_key=api_key)
 
-# Groq API endpoint
+# Groq API (endpoint set by MEDIBOT_GROQ_URL, see llm_providers.py)
 OPENROUTER_API_KEY = api_key
-OPENROUTER_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_MODEL = "llama-3.3-70b-versatile"  # ✅ supported model
+# Bump when the medicine prompt changes so cached answers to the old prompt are not reused
+PROMPT_VERSION = 1
+
+# ---------------- WORKER CONFIG ----------------
+# Medicine images analyzed at the same time (OCR + LLM call each), off the Tk thread
+ANALYSIS_WORKERS = int(os.environ.get("MEDIBOT_GUI_WORKERS", "4"))
+POLL_MS = 100  # how often finished analyses are picked up on the Tk thread
 
 # ---------------- OCR CONFIG ----------------
 pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
 
-# ---------------- MOCK DATA ----------------
-mock_doctors = {
-    'General Physician': [
-        {"name": "Dr. Rajesh Sharma", "specialty": "General Medicine", "experience": "15 years",
-         "contact": "+91 98765 43210", "address": "Care Hospital", "distance": "2.3 km"},
-        {"name": "Dr. Priya Patel", "specialty": "Family Medicine", "experience": "12 years",
-         "contact": "+91 98765 43211", "address": "Fortis Hospital", "distance": "3.1 km"},
-    ],
-    'Cardiologist': [
-        {"name": "Dr. Sunita Mehta", "specialty": "Cardiology", "experience": "20 years",
-         "contact": "+91 98765 43213", "address": "Sahyadri Hospital", "distance": "2.8 km"},
-    ],
-    'Neurologist': [
-        {"name": "Dr. Neha Singh", "specialty": "Neurology", "experience": "14 years",
-         "contact": "+91 98765 43215", "address": "Deenanath Hospital", "distance": "2.1 km"},
-    ],
-    'Orthopedic': [
-        {"name": "Dr. Sanjay Kulkarni", "specialty": "Orthopedics", "experience": "13 years",
-         "contact": "+91 98765 43217", "address": "Aditya Birla Hospital", "distance": "2.9 km"},
-    ]
-}
+# ---------------- DOCTOR DIRECTORY ----------------
+# Doctors are loaded from data/doctors.csv (MEDIBOT_DOCTOR_DIRECTORY) and searched
+# around MEDIBOT_USER_LOCATION, see doctor_store.py
+DOCTORS_SHOWN = 5
 
 
 # ---------------- APP CLASS ----------------
+class AnalysisBatch:
+    """
+    Images queued by one click of "Analyze Medicine" and their pending work.
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.futures = []
+        self.cancelled = threading.Event()
+        self.finished = 0
+        self.analyzed = 0
+        self.local_matches = {}  # image path -> catalogue entry identified without the LLM
+        self.specialties = Counter()
+
+    @property
+    def done(self):
+        return self.finished == len(self.paths)
+
+    def cancel(self):
+        self.cancelled.set()
+        for future in self.futures:
+            future.cancel()
+
+
 class MediCareApp:
     SPECIALTY_KEYWORDS = {
         "General Physician": ["fever", "cold", "cough", "pain", "infection"],
@@ -59,21 +84,30 @@ class MediCareApp:
         "Neurologist": ["brain", "nerve", "migraine", "seizure"],
         "Orthopedic": ["bone", "joint", "fracture", "sprain"],
     }
+    SPECIALTY_MATCHER = SpecialtyMatcher(SPECIALTY_KEYWORDS)
 
     def __init__(self, root):
         self.root = root
         self.root.title("MediCare Assistant")
         self.root.geometry("900x650")
 
-        self.selected_image = None
+        self.selected_images = []
         self.ocr_text = ""
         self.gemini_info = ""
         self.recommended_specialty = "General Physician"
 
+        # OCR and LLM calls run on worker threads; their results come back through
+        # this queue and are applied to widgets on the Tk thread by _poll_results
+        self.executor = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix="medicare-analysis")
+        self.results = queue.Queue()
+        self.batch = None
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
         self.create_header()
         self.create_tabs()
         self.create_content_frame()
         self.show_medicine_scanner()
+        self.root.after(POLL_MS, self._poll_results)
 
     def create_header(self):
         header = tk.Frame(self.root, bg="#f5e6f7")
@@ -105,45 +139,174 @@ class MediCareApp:
     def show_medicine_scanner(self):
         self.clear_content()
 
-        tk.Label(self.content, text="Upload Medicine Image", font=("Helvetica", 14)).pack(pady=10)
-        upload_btn = ttk.Button(self.content, text="Select Image", command=self.select_image)
+        tk.Label(self.content, text="Upload Medicine Images", font=("Helvetica", 14)).pack(pady=10)
+        upload_btn = ttk.Button(self.content, text="Select Images", command=self.select_image)
         upload_btn.pack(pady=10)
 
-        self.image_label = tk.Label(self.content)
+        self.image_label = tk.Label(self.content, compound="top")
         self.image_label.pack()
 
-        analyze_btn = ttk.Button(self.content, text="Analyze Medicine", command=self.analyze_image)
-        analyze_btn.pack(pady=10)
+        buttons = tk.Frame(self.content)
+        buttons.pack(pady=10)
+        self.analyze_btn = ttk.Button(buttons, text="Analyze Medicine", command=self.analyze_image)
+        self.analyze_btn.pack(side="left", padx=5)
+        self.cancel_btn = ttk.Button(buttons, text="Cancel", command=self.cancel_analysis, state="disabled")
+        self.cancel_btn.pack(side="left", padx=5)
+
+        self.progress = ttk.Progressbar(self.content, length=400, mode="determinate")
+        self.progress.pack(pady=5)
+        self.status_label = tk.Label(self.content, text="")
+        self.status_label.pack()
 
         self.result_box = tk.Text(self.content, height=15, width=100, wrap="word")
         self.result_box.pack(pady=10)
 
+        self.next_frame = tk.Frame(self.content)
+        self.next_frame.pack()
+
+        if self.batch and not self.batch.done:
+            self._set_running(True)
+
     def select_image(self):
-        file_path = filedialog.askopenfilename(filetypes=[("Image files", "*.png *.jpg *.jpeg")])
-        if file_path:
-            img = Image.open(file_path)
+        file_paths = filedialog.askopenfilenames(filetypes=[("Image files", "*.png *.jpg *.jpeg")])
+        if file_paths:
+            img = Image.open(file_paths[0])
             img.thumbnail((300, 300))
             self.tk_img = ImageTk.PhotoImage(img)
-            self.image_label.configure(image=self.tk_img)
-            self.selected_image = file_path
+            more = f" (+{len(file_paths) - 1} more)" if len(file_paths) > 1 else ""
+            self.image_label.configure(image=self.tk_img, text=f"{os.path.basename(file_paths[0])}{more}")
+            self.selected_images = list(file_paths)
 
     def analyze_image(self):
-        if not self.selected_image:
+        if not self.selected_images:
             messagebox.showwarning("No Image", "Please select an image first.")
             return
 
-        text = self.perform_ocr(self.selected_image)
-        self.ocr_text = text
-
-        gemini_ans = self.ask_gemini_for_usage_and_warning(text)
-        self.gemini_info = gemini_ans
+        self._start_batch(list(self.selected_images), self.analyze_medicine)
 
+    def _start_batch(self, paths, work):
+        """
+        Submits `work(path, cancelled)` for every path to the worker pool.
+        """
+        batch = AnalysisBatch(paths)
+        self.batch = batch
         self.result_box.delete(1.0, tk.END)
-        self.result_box.insert(tk.END, gemini_ans)
-
-        next_btn = ttk.Button(self.content, text=f"Find {self.recommended_specialty} Nearby",
-                              command=lambda: self.show_doctors(self.recommended_specialty))
-        next_btn.pack(pady=10)
+        for widget in self.next_frame.winfo_children():
+            widget.destroy()
+        self.progress.configure(maximum=len(batch.paths), value=0)
+        self._set_running(True)
+
+        for path in batch.paths:
+            future = self.executor.submit(work, path, batch.cancelled)
+            future.add_done_callback(lambda f, path=path: self.results.put((batch, path, f)))
+            batch.futures.append(future)
+
+    def cancel_analysis(self):
+        if self.batch and not self.batch.done:
+            self.batch.cancel()
+            self._set_running(True)
+
+    def analyze_medicine(self, image_path, cancelled):
+        """
+        Runs OCR and identifies the medicine for one image. Called on a worker thread, so it must not touch widgets.
+        A confident match in the local catalogue answers in milliseconds; otherwise the LLM is asked.
+        Returns (ocr text, answer, recommended specialty, catalogue entry or None), or None if cancelled.
+        """
+        text = self.perform_ocr(image_path)
+        if cancelled.is_set():
+            return None
+
+        index = medicine_index.get_default_index()
+        candidates = index.search(text, limit=3)
+        if candidates and candidates[0]["score"] >= medicine_index.CONFIDENT_SCORE:
+            medicine = candidates[0]["medicine"]
+            answer = (f"{format_medicine(medicine)}\n"
+                      f"(Identified from the local catalogue, {candidates[0]['score']:.0%} match)")
+            return text, answer, self.recommend_specialty(medicine["usage"]), medicine
+
+        hints = [c["medicine"] for c in candidates if c["score"] >= 0.4]
+        answer = self.ask_gemini_for_usage_and_warning(text, candidates=hints)
+        return text, answer, self.recommend_specialty(answer), None
+
+    def explain_medicine(self, medicine, cancelled):
+        """
+        Asks the LLM for a plain-English explanation of a medicine identified locally.
+        """
+        if cancelled.is_set():
+            return None
+        name = f"{medicine['name']} ({medicine['generic']} {medicine['strength']})"
+        answer = self.ask_gemini_for_usage_and_warning(name)
+        return name, answer, self.recommend_specialty(medicine["usage"]), None
+
+    def _poll_results(self):
+        while True:
+            try:
+                batch, path, future = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self._show_result(batch, path, future)
+        self.root.after(POLL_MS, self._poll_results)
+
+    def _show_result(self, batch, path, future):
+        batch.finished += 1
+        if batch is not self.batch:
+            return  # a newer batch replaced this one
+
+        outcome = None
+        if not future.cancelled() and not batch.cancelled.is_set():
+            try:
+                outcome = future.result()
+            except Exception as e:
+                print("❌ Exception:", e)
+                outcome = None, f"Could not analyze this image: {e}", None, None
+
+        if outcome:
+            text, answer, specialty, medicine = outcome
+            if medicine:
+                batch.local_matches[path] = medicine
+            if specialty:
+                self.ocr_text, self.gemini_info = text, answer
+                batch.analyzed += 1
+                batch.specialties[specialty] += 1
+            if self.result_box.winfo_exists():
+                self.result_box.insert(tk.END, f"=== {os.path.basename(path)} ===\n{answer}\n\n")
+
+        if self.progress.winfo_exists():
+            self.progress.configure(value=batch.finished)
+            self._set_running(not batch.done)
+
+        if batch.done and batch.specialties:
+            self.recommended_specialty = batch.specialties.most_common(1)[0][0]
+            if self.next_frame.winfo_exists():
+                ttk.Button(self.next_frame, text=f"Find {self.recommended_specialty} Nearby",
+                           command=lambda: self.show_doctors(self.recommended_specialty)).pack(pady=10)
+
+        if batch.done and batch.local_matches and self.next_frame.winfo_exists():
+            matches = dict(batch.local_matches)
+            ttk.Button(self.next_frame, text="🤖 Explain in plain English",
+                       command=lambda: self._start_batch(
+                           list(matches), lambda path, cancelled: self.explain_medicine(matches[path], cancelled)
+                       )).pack(pady=5)
+
+    def _set_running(self, running):
+        batch = self.batch
+        if running and batch.cancelled.is_set():
+            status = "Cancelling..."
+        elif running:
+            status = f"Analyzing... {batch.finished} of {len(batch.paths)} done"
+        elif batch.cancelled.is_set():
+            status = f"Cancelled after {batch.analyzed} of {len(batch.paths)} images"
+        else:
+            status = f"Done: {len(batch.paths)} image(s) analyzed"
+        self.status_label.configure(text=status)
+        self.analyze_btn.configure(state="disabled" if running else "normal")
+        self.cancel_btn.configure(state="normal" if running else "disabled")
+
+    def on_close(self):
+        if self.batch:
+            self.batch.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.root.destroy()
 
     def perform_ocr(self, image_path):
         img = cv2.imread(image_path)
@@ -151,18 +314,23 @@ class MediCareApp:
         contrast = cv2.convertScaleAbs(gray, alpha=1.8, beta=30)
 
         config = r'--oem 1 --psm 6'
-        raw_text = pytesseract.image_to_string(contrast, config=config)
+        raw_text = ocr_engine.image_to_string(contrast, config=config)
         cleaned = re.sub(r'[^a-zA-Z0-9\s]', '', raw_text.lower()).strip()
         print("\n🔎 OCR Raw:\n", raw_text)
         print("\n🧼 OCR Cleaned:\n", cleaned)
 
         return cleaned
 
-    def ask_gemini_for_usage_and_warning(self, text):
+    def ask_gemini_for_usage_and_warning(self, text, candidates=()):
+        # Near matches from the local catalogue help the model with badly scanned names
+        hint = ""
+        if candidates:
+            hint = "Closest names in our medicine list: " + ", ".join(
+                f"{c['name']} ({c['generic']} {c['strength']})" for c in candidates) + "\n"
         prompt = f"""
 I scanned this text from a medicine box:
 \"{text}\"
-
+{hint}
 👉 Please:
 1️⃣ Identify the correct medicine name.
 2️⃣ State the usual dose and strength clearly.
@@ -175,35 +343,26 @@ Keep it short, clear and easy to read.
 Use short sentences.
 """
 
+        response_cache = llm_cache.get_default_cache()
+        cache_key = response_cache.make_key(text + hint, PROMPT_VERSION, "medicine_info", GROQ_MODEL)
+
         try:
-            response = requests.post(
-                OPENROUTER_URL,
-                headers={
-                    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "llama-3.3-70b-versatile",  # ✅ supported model
-                    "messages": [
-                        {"role": "user", "content": prompt}
-                    ]
-                }
-            )
-            data = response.json()
-            print("⚙ RAW OpenRouter response:\n", data)
-
-            if "error" in data:
-                error_msg = data["error"].get("message", "Unknown error")
-                print("❌ Model error:", error_msg)
-                return f"Error from model: {error_msg}"
-
-            answer = data["choices"][0]["message"]["content"]
-
-            self.recommended_specialty = "General Physician"
-            for specialty, keywords in self.SPECIALTY_KEYWORDS.items():
-                if any(keyword in answer.lower() for keyword in keywords):
-                    self.recommended_specialty = specialty
-                    break
+            answer = response_cache.get(cache_key)
+            if answer is not None:
+                print("♻️ Answer served from the response cache:", response_cache.stats())
+            else:
+                start = time.perf_counter()
+                provider = llm_providers.get_provider("groq", OPENROUTER_API_KEY, model=GROQ_MODEL)
+                try:
+                    result = provider.generate(prompt)
+                except llm_providers.LLMError as e:
+                    print("❌ Model error:", e)
+                    return f"Error from model: {e}"
+                print("⚙ Groq response:", result)
+
+                answer = result["text"]
+                response_cache.put(cache_key, answer, model=GROQ_MODEL,
+                                   latency_s=time.perf_counter() - start)
 
             return answer
 
@@ -211,11 +370,14 @@ Use short sentences.
             print("❌ Exception:", e)
             return "Something went wrong while getting response from the AI."
 
+    def recommend_specialty(self, answer):
+        return self.SPECIALTY_MATCHER.best(answer, default="General Physician")
+
     def show_doctors(self, specialty=None):
         self.clear_content()
 
         tk.Label(self.content, text="Choose Specialty", font=("Helvetica", 14)).pack(pady=10)
-        specialties = ["General Physician", "Cardiologist", "Neurologist", "Orthopedic"]
+        specialties = doctor_store.get_default_store().specialties()
 
         for spec in specialties:
             btn = ttk.Button(self.content, text=spec, command=lambda s=spec: self.show_doctor_list(s))
@@ -228,11 +390,13 @@ Use short sentences.
         self.clear_content()
         tk.Label(self.content, text=f"{specialty} Doctors Near You", font=("Helvetica", 14, "bold")).pack(pady=10)
 
-        for doc in mock_doctors.get(specialty, []):
+        lat, lon = doctor_store.DEFAULT_LOCATION
+        for doc in doctor_store.get_default_store().nearest(lat, lon, k=DOCTORS_SHOWN, specialty=specialty):
             frame = tk.LabelFrame(self.content, text=doc['name'], padx=10, pady=5)
             frame.pack(fill="x", padx=20, pady=5)
 
-            info = f"{doc['specialty']} | {doc['experience']}\n📞 {doc['contact']}\n📍 {doc['address']} ({doc['distance']})"
+            info = (f"{doc['field']} | {doc['experience_years']} years\n📞 {doc['contact']}\n"
+                    f"📍 {doc['address']} ({doc['distance_km']:.1f} km)")
             tk.Label(frame, text=info, anchor="w", justify="left").pack(fill="x")
 
         tk.Button(
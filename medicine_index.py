@@ -0,0 +1,169 @@
+import csv
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+
+# Medicine catalogue (CSV or SQLite) and the score above which a local match is trusted
+DEFAULT_CATALOGUE = os.environ.get(
+    "MEDIBOT_MEDICINE_CATALOGUE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "medicines.csv")
+)
+CONFIDENT_SCORE = float(os.environ.get("MEDIBOT_MEDICINE_MATCH", "0.75"))
+# Many brands share a generic, so a generic name alone never reaches CONFIDENT_SCORE
+FIELD_WEIGHTS = {"name": 1.0, "generic": 0.6}
+
+# Numbers printed as a dose ("650", "40 mg", "250mg/5ml"), as opposed to dates, batch
+# codes or pack sizes glued to other characters
+STRENGTH_RE = re.compile(r"(?<![\w./-])\d+(?:\.\d+)?(?:\s*(?:mg|mcg|g|ml|iu|%)(?:/\s*\d*\s*(?:ml|g))?)?(?![\w/-])",
+                         re.IGNORECASE)
+
+# Digits OCR tends to put in place of letters inside words ("d0l0" -> "dolo")
+OCR_LETTER_FOLDS = str.maketrans({"0": "o", "1": "l", "5": "s", "8": "b"})
+
+
+def normalize_name(text):
+    """
+    Lowercases a name and keeps only letters, so "Dolo-650" and "dolo 650" both index as "dolo".
+    """
+    return " ".join(re.findall(r"[a-z]+", text.lower()))
+
+
+def query_words(text):
+    """
+    Splits OCR text into letter-only words, folding digits that sit inside words back into letters.
+    """
+    words = []
+    for token in re.findall(r"[a-z0-9]+", text.lower()):
+        if re.search(r"[a-z]", token):
+            token = token.translate(OCR_LETTER_FOLDS)
+        words.extend(re.findall(r"[a-z]+", token))
+    return words
+
+
+def trigrams(text):
+    padded = f"${text.replace(' ', '$')}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class MedicineIndex:
+    """
+    Character trigram index over medicine brand and generic names. Lookups score
+    every name sharing trigrams with a window of OCR words (Dice coefficient), so
+    a few misread characters still find the right product.
+    """
+
+    def __init__(self, records):
+        self.records = list(records)
+        self._keys = []  # (record index, field, normalized name, trigram count)
+        self._postings = defaultdict(list)
+        self.max_words = 1
+
+        for i, record in enumerate(self.records):
+            for field in ("name", "generic"):
+                name = normalize_name(record.get(field) or "")
+                if not name:
+                    continue
+                grams = trigrams(name)
+                key_id = len(self._keys)
+                self._keys.append((i, field, name, len(grams)))
+                for gram in grams:
+                    self._postings[gram].append(key_id)
+                self.max_words = max(self.max_words, len(name.split()))
+
+    @classmethod
+    def from_csv(cls, path):
+        with open(path, newline="", encoding="utf-8") as f:
+            return cls(csv.DictReader(f))
+
+    @classmethod
+    def from_sqlite(cls, path, table="medicines"):
+        conn = sqlite3.connect(path)
+        try:
+            conn.row_factory = sqlite3.Row
+            return cls(dict(row) for row in conn.execute(f"SELECT * FROM {table}"))
+        finally:
+            conn.close()
+
+    @classmethod
+    def load(cls, path=DEFAULT_CATALOGUE):
+        """
+        Loads a catalogue from a .csv file or a SQLite database (.db/.sqlite/.sqlite3).
+        """
+        if path.lower().endswith(".csv"):
+            return cls.from_csv(path)
+        return cls.from_sqlite(path)
+
+    def search(self, text, limit=5):
+        """
+        Returns up to `limit` candidates for OCR text, best first, as dicts with
+        the catalogue "medicine", its "score" (0-1), and the "matched" words and field.
+        """
+        words = query_words(text)
+        numbers = set(re.findall(r"\d+", text))
+        printed = {n for m in STRENGTH_RE.finditer(text) for n in re.findall(r"\d+", m.group(0))}
+        best = {}
+
+        for start in range(len(words)):
+            for size in range(1, self.max_words + 1):
+                if start + size > len(words):
+                    break
+                window = " ".join(words[start:start + size])
+                grams = trigrams(window)
+                shared = Counter(key_id for gram in grams for key_id in self._postings.get(gram, ()))
+                for key_id, count in shared.items():
+                    i, field, name, key_grams = self._keys[key_id]
+                    score = FIELD_WEIGHTS[field] * 2 * count / (len(grams) + key_grams)
+                    if score > best.get(i, (0,))[0]:
+                        best[i] = (score, window, field)
+
+        results = []
+        for i, (score, window, field) in best.items():
+            record = self.records[i]
+            # A printed strength matching the catalogue ("650") separates variants of one brand
+            strength_numbers = re.findall(r"\d+", record.get("strength") or "")
+            if strength_numbers and set(strength_numbers) <= numbers:
+                score = min(1.0, score + 0.1)
+            # A printed strength that differs ("Pan 20" against Pan 40) is another product:
+            # keep it as a candidate but never trust it without the LLM
+            elif strength_numbers and printed and strength_numbers[0] not in printed:
+                score = min(score, CONFIDENT_SCORE - 0.05)
+            results.append({"medicine": record, "score": round(score, 3), "matched": window, "field": field})
+        results.sort(key=lambda r: r["score"], reverse=True)
+        return results[:limit]
+
+    def best_match(self, text):
+        """
+        Returns the top candidate if its score reaches CONFIDENT_SCORE, else None.
+        """
+        results = self.search(text, limit=1)
+        if results and results[0]["score"] >= CONFIDENT_SCORE:
+            return results[0]
+        return None
+
+
+def format_medicine(record):
+    """
+    Renders a catalogue entry as the plain text shown to the patient.
+    """
+    return (
+        f"💊 {record['name']} ({record['generic']} {record['strength']}, {record['form']})\n"
+        f"🏭 Manufacturer: {record['manufacturer']}\n"
+        f"✅ Used for: {record['usage']}\n"
+        f"⚠️ Warnings: {record['warnings']}"
+    )
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_default_index():
+    """
+    Returns the process-wide index over the configured catalogue, loading it on first use.
+    """
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = MedicineIndex.load()
+        return _default_index
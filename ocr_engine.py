@@ -0,0 +1,210 @@
+import os
+import queue
+import shlex
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from lazy_imports import lazy_module
+
+# tesserocr binds the Tesseract C++ API, so an engine loads its traineddata once and
+# recognizes images straight from memory. Without it we fall back to pytesseract,
+# which writes the image to a temp file and starts a tesseract process per call.
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+# Only needed without tesserocr, and slow to import (it pulls in pandas when installed)
+pytesseract = lazy_module("pytesseract")
+
+# Maximum engines (and so concurrent recognitions) per config in this process
+DEFAULT_POOL_SIZE = int(os.environ.get("MEDIBOT_OCR_ENGINES", os.cpu_count() or 1))
+# How often idle engines are checked (at checkout) for ones that stopped responding
+HEALTH_CHECK_S = float(os.environ.get("MEDIBOT_OCR_HEALTH_CHECK_S", "60"))
+
+
+def parse_config(config):
+    """
+    Splits a pytesseract-style config string ("--oem 3 --psm 6 -c key=value")
+    into (lang, oem, psm, variables).
+    """
+    lang, oem, psm, variables = "eng", 3, 3, {}
+    args = shlex.split(config or "")
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        value = args[i + 1] if i + 1 < len(args) else None
+        if arg == "--oem":
+            oem = int(value)
+        elif arg == "--psm":
+            psm = int(value)
+        elif arg == "-l":
+            lang = value
+        elif arg == "-c" and value and "=" in value:
+            key, _, val = value.partition("=")
+            variables[key] = val
+        else:
+            i += 1
+            continue
+        i += 2
+    return lang, oem, psm, variables
+
+
+class TesseractPool:
+    """
+    Bounded pool of long-lived Tesseract engines sharing one config.
+    Engines are created lazily (or by prewarm) up to `size`, checked before reuse
+    and replaced if a recognition fails; every `health_check_s`, and after a
+    failure, the idle ones are all checked.
+    """
+
+    def __init__(self, config="", size=DEFAULT_POOL_SIZE, timeout=120, health_check_s=HEALTH_CHECK_S):
+        self.config = config
+        self.lang, self.oem, self.psm, self.variables = parse_config(config)
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.health_check_s = health_check_s
+        self._checked = time.monotonic()
+
+        # LIFO so the most recently used (hottest) engine is picked first
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+
+    @property
+    def warm(self):
+        """
+        True when engines are persistent (tesserocr is available).
+        """
+        return tesserocr is not None
+
+    def _new_engine(self):
+        api = tesserocr.PyTessBaseAPI(lang=self.lang, oem=self.oem, psm=self.psm)
+        for key, value in self.variables.items():
+            api.SetVariable(key, value)
+        return api
+
+    @staticmethod
+    def _is_healthy(api):
+        try:
+            return bool(api.GetInitLanguagesAsString())
+        except Exception:
+            return False
+
+    def _checkout(self):
+        if time.monotonic() - self._checked > self.health_check_s:
+            self.health_check()
+        while True:
+            try:
+                api = self._idle.get_nowait()
+            except queue.Empty:
+                return self._new_engine()
+            if self._is_healthy(api):
+                return api
+            api.End()
+
+    def prewarm(self, count=None):
+        """
+        Starts `count` engines (default: the pool size) ahead of the first request.
+        """
+        if not self.warm:
+            return
+        for _ in range(min(count or self.size, self.size) - self._idle.qsize()):
+            self._idle.put(self._new_engine())
+
+    def health_check(self):
+        """
+        Drops idle engines that no longer respond; returns the number still healthy.
+        """
+        self._checked = time.monotonic()
+        healthy = []
+        while True:
+            try:
+                api = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if self._is_healthy(api):
+                healthy.append(api)
+            else:
+                api.End()
+        for api in healthy:
+            self._idle.put(api)
+        return len(healthy)
+
+    def image_to_string(self, image):
+        """
+        Recognizes a grayscale/RGB NumPy array or PIL image and returns its text.
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("Timed out waiting for a free OCR engine.")
+        try:
+            if not self.warm:
+                return pytesseract.image_to_string(image, config=self.config)
+
+            api = self._checkout()
+            try:
+                set_image(api, image)
+                text = api.GetUTF8Text()
+                api.Clear()
+            except Exception:
+                # Don't hand a possibly broken engine to the next caller, and weed
+                # out any others that went down with it
+                api.End()
+                self.health_check()
+                raise
+            self._idle.put(api)
+            return text
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """
+        Shuts down all idle engines.
+        """
+        while True:
+            try:
+                self._idle.get_nowait().End()
+            except queue.Empty:
+                break
+
+
+def set_image(api, image):
+    """
+    Hands pixels to a tesserocr engine without encoding them to a file format.
+    """
+    if isinstance(image, Image.Image):
+        image = np.asarray(image if image.mode in ("L", "RGB") else image.convert("RGB"))
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    height, width = image.shape[:2]
+    bytes_per_pixel = 1 if image.ndim == 2 else image.shape[2]
+    api.SetImageBytes(image.tobytes(), width, height, bytes_per_pixel, image.strides[0])
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(config=""):
+    """
+    Returns the process-wide pool for `config`, creating it on first use.
+    """
+    with _pools_lock:
+        if config not in _pools:
+            _pools[config] = TesseractPool(config)
+        return _pools[config]
+
+
+def prewarm(config="", count=None):
+    """
+    Starts `count` engines (default: the pool size) for `config` now, so the first
+    page doesn't pay for loading the traineddata. Does nothing without tesserocr.
+    """
+    get_pool(config).prewarm(count)
+
+
+def image_to_string(image, config=""):
+    """
+    Drop-in replacement for pytesseract.image_to_string backed by a warm engine pool.
+    """
+    return get_pool(config).image_to_string(image)
@@ -0,0 +1,213 @@
+import asyncio
+import math
+import os
+import re
+import textwrap
+from collections import Counter
+
+import tracing
+from lab_values import format_records, parse_line
+
+# Prompts above this many (estimated) tokens are split into chunks that are
+# analyzed in parallel and merged by one final call
+DEFAULT_TOKEN_BUDGET = int(os.environ.get("MEDIBOT_PROMPT_TOKEN_BUDGET", "6000"))
+CHARS_PER_TOKEN = 4  # rough average for English text with both Gemini and Llama tokenizers
+
+# Lines that only draw rules or boxes ("-----", "=====", "|___|")
+_RULE_RE = re.compile(r"^[\s\-_=*~.|+:]*$")
+EDGE_LINES = 3  # lines at the top and bottom of a page checked for headers/footers
+# The parts of a header/footer that change from page to page: page numbers
+# ("Page 2 of 5", "2/5", a line holding just "- 2 -"), dates and times
+_PAGE_NUMBER_RE = re.compile(r"\bpage\s*\d+(?:\s*(?:of|/)\s*\d+)?|^\W*\d{1,3}(?:\s*(?:of|/)\s*\d{1,3})?\W*$",
+                             re.IGNORECASE)
+_DATE_RE = re.compile(r"(?<!\d)\d{1,4}([/.-])\d{1,2}\1\d{2,4}(?!\d)|(?<!\d)\d{1,2}:\d{2}(?::\d{2})?(?!\d)")
+
+# Bump when ANALYSIS_INSTRUCTIONS change so cached answers to old prompts are not reused
+PROMPT_VERSION = 2
+
+ANALYSIS_INSTRUCTIONS = {
+    "Quick Summary": """
+Give a short summary of this medical report in 3-5 bullet points:
+what the report is, which values are abnormal, and whether a doctor should be consulted.
+""",
+    "Full Analysis": """
+Analyze this medical report and provide:
+1. **Report Type**: Identify what kind of medical test/report this is
+2. **Key Values**: List all important medical values with their units
+3. **Normal Ranges**: Show normal ranges for each value
+4. **Interpretation**: Explain what the values mean in simple terms
+5. **Abnormal Findings**: Highlight any values outside normal range
+6. **Recommendations**: Suggest if consultation with a doctor is needed
+""",
+}
+
+MAP_INSTRUCTIONS = """
+This is part {part} of {parts} of a medical report.
+List every test with its value, unit, reference range and whether it is abnormal,
+plus any diagnosis, impression or doctor's note. Be brief and do not interpret yet.
+"""
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def serialize_table(rows):
+    """
+    Renders table rows as "cell | cell" lines, without the padding DataFrame.to_string
+    adds, dropping empty rows, empty columns and trailing empty cells.
+    """
+    rows = [[re.sub(r"\s+", " ", str(cell)).strip() for cell in row] for row in rows]
+    rows = [row for row in rows if any(row)]
+    if not rows:
+        return ""
+    width = max(len(row) for row in rows)
+    columns = [j for j in range(width) if any(j < len(row) and row[j] for row in rows)]
+    lines = []
+    for row in rows:
+        cells = [row[j] if j < len(row) else "" for j in columns]
+        while cells and not cells[-1]:
+            cells.pop()
+        lines.append(" | ".join(cells))
+    return "\n".join(lines)
+
+
+def _line_key(line):
+    # Page numbers and dates change from page to page; everything else, result
+    # values included, has to match exactly
+    return _DATE_RE.sub("#", _PAGE_NUMBER_RE.sub("#", line))
+
+
+def repeated_edge_lines(pages):
+    """
+    Returns keys of lines found near the top or bottom of most pages
+    (letterheads, patient banners, "Page N of M", disclaimers).
+    """
+    if len(pages) < 2:
+        return set()
+    counts = Counter()
+    for page in pages:
+        lines = [line for line in page if line]
+        counts.update({_line_key(line) for line in lines[:EDGE_LINES] + lines[-EDGE_LINES:]})
+    threshold = max(2, math.ceil(len(pages) * 0.6))
+    return {key for key, n in counts.items() if n >= threshold}
+
+
+def compact_pages(pages, drop=None):
+    """
+    Joins page texts with redundant whitespace, rule lines and repeated
+    headers/footers removed (their first occurrence is kept). Lines for which
+    `drop(line)` is true are left out too, after headers/footers are detected.
+    """
+    pages = [[re.sub(r"[ \t]+", " ", line).strip() for line in page.splitlines()] for page in pages]
+    repeated = repeated_edge_lines(pages)
+    seen = set()
+    out = []
+    for page in pages:
+        for line in page:
+            if not line or _RULE_RE.match(line) or (drop is not None and drop(line)):
+                continue
+            key = _line_key(line)
+            if key in repeated:
+                if key in seen:
+                    continue
+                seen.add(key)
+            out.append(line)
+    return "\n".join(out)
+
+
+def chunk_text(text, max_tokens):
+    """
+    Splits text at line boundaries into pieces of at most `max_tokens` estimated tokens.
+    """
+    max_chars = max(1, max_tokens * CHARS_PER_TOKEN)
+    chunks, current, size = [], [], 0
+    for line in text.splitlines():
+        while len(line) > max_chars:
+            chunks.append(line[:max_chars])
+            line = line[max_chars:]
+        if current and size + len(line) + 1 > max_chars:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def report_pages(page_texts, lab_records):
+    """
+    Returns the pages to analyze: the extracted lab records, which are far shorter
+    than raw OCR text, followed by the compacted report lines that were not turned
+    into a record (tests the parser doesn't know, notes, impressions), as a single
+    page. Returns the page texts themselves if no records were found.
+    """
+    if not lab_records:
+        return page_texts
+    # Headers/footers are detected on the real pages, before the record lines go
+    other = compact_pages(page_texts, drop=lambda line: parse_line(line) is not None)
+    text = "Extracted lab values (test: value unit (reference range) flag):\n" + format_records(lab_records) + "\n"
+    if other:
+        text += f"\nOther report lines:\n{other}\n"
+    return [text]
+
+
+def render_prompt(instructions, report_text):
+    return (f"{textwrap.dedent(instructions).strip()}\n\n"
+            f"Medical Report Text:\n{report_text}\n\n"
+            "Format your response clearly with headers and bullet points.")
+
+
+def map_prompts(chunks):
+    return [f"{textwrap.dedent(MAP_INSTRUCTIONS).strip().format(part=i, parts=len(chunks))}\n\n{chunk}"
+            for i, chunk in enumerate(chunks, start=1)]
+
+
+def reduce_report(partials):
+    """
+    Joins the per-chunk notes into the report text of the final prompt.
+    """
+    return "\n\n".join(f"Notes from part {i}:\n{notes.strip()}" for i, notes in enumerate(partials, start=1))
+
+
+async def analyze_chunks(provider, chunks):
+    """
+    Runs the map step for all chunks concurrently (bounded by the provider's limit).
+    """
+    results = await asyncio.gather(*(provider.agenerate(prompt) for prompt in map_prompts(chunks)))
+    return [result["text"] for result in results]
+
+
+def build_prompt(instructions, pages, provider=None, budget=DEFAULT_TOKEN_BUDGET, raw_pages=None):
+    """
+    Builds the analysis prompt for a report given as a list of page texts.
+    Reports over `budget` tokens are chunked and pre-analyzed in parallel through
+    `provider`, and the prompt asks for the final answer from those notes.
+    `raw_pages` are the extracted page texts when `pages` came from report_pages.
+    Returns (prompt, stats) where stats holds token estimates of the prompt
+    with the raw text, with the compacted text and as sent, the tokens saved
+    between the first two, and the number of chunks.
+    """
+    report_text = compact_pages(pages)
+    with tracing.span("prompt_build") as span:
+        prompt = render_prompt(instructions, report_text)
+        chunks = 1
+        if estimate_tokens(prompt) > budget and provider is not None:
+            parts = chunk_text(report_text, max(budget - estimate_tokens(MAP_INSTRUCTIONS), 256))
+            chunks = len(parts)
+            partials = asyncio.run(analyze_chunks(provider, parts))
+            prompt = render_prompt(instructions, reduce_report(partials))
+
+        # Same wrapper on both sides, so only the report text differs
+        raw_tokens = estimate_tokens(render_prompt(instructions, "".join(raw_pages or pages)))
+        compact_tokens = estimate_tokens(render_prompt(instructions, report_text))
+        stats = {
+            "raw_tokens": raw_tokens,
+            "compact_tokens": compact_tokens,
+            "prompt_tokens": estimate_tokens(prompt),
+            "tokens_saved": max(0, raw_tokens - compact_tokens),
+            "chunks": chunks,
+        }
+        span.set(**stats)
+    return prompt, stats
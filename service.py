@@ -0,0 +1,337 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import mimetypes
+import os
+import tempfile
+import threading
+
+from aiohttp import web
+
+import llm_cache
+import llm_providers
+import prompt_builder
+import tracing
+from fake_llm_server import FakeLLMServer
+from job_queue import DONE, FINISHED, QueueFull, content_key, get_default_scheduler
+from lab_values import extract_lab_values
+from trial import get_file_type, prewarm, sniff_file_type
+
+# Largest upload accepted, and the size above which an upload is spooled to a
+# temporary file instead of being held in memory
+MAX_UPLOAD_MB = float(os.environ.get("MEDIBOT_SERVICE_MAX_UPLOAD_MB", "50"))
+SPOOL_MB = float(os.environ.get("MEDIBOT_SERVICE_SPOOL_MB", "4"))
+
+GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "")
+GEMINI_MODEL = "gemini-2.5-flash"  # same model as app.py, so both share cached answers
+VALUES_ONLY = "Value Extraction Only"
+
+CHUNK_BYTES = 64 * 1024
+SNIFF_BYTES = 12  # enough of the start of an unnamed upload to recognize its type
+POLL_S = 0.2  # how often a request checks on its extraction job
+
+
+class Upload:
+    """
+    A received file: its bytes, or the path of the temporary file it was spooled
+    to, plus the name used to detect its type and its job queue key.
+    """
+
+    def __init__(self, data, path, filename, key):
+        self.data = data
+        self.path = path
+        self.filename = filename
+        self.key = key
+
+    @property
+    def source(self):
+        return self.path if self.path is not None else self.data
+
+
+async def _part_chunks(part):
+    while True:
+        chunk = await part.read_chunk(CHUNK_BYTES)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def _upload_stream(request):
+    """
+    Returns (filename, async iterator of chunks) for the first file field of a
+    multipart body, or for a raw body named by the "filename" query parameter.
+    """
+    if request.content_type.startswith("multipart/"):
+        reader = await request.multipart()
+        while True:
+            part = await reader.next()
+            if part is None:
+                raise web.HTTPBadRequest(text="No file field in the multipart body.")
+            if part.filename:
+                return part.filename, _part_chunks(part)
+    return request.query.get("filename"), request.content.iter_chunked(CHUNK_BYTES)
+
+
+def _sniffed_filename(head):
+    file_type = sniff_file_type(head)
+    if file_type is None:
+        raise web.HTTPUnsupportedMediaType(text="Unsupported file type: upload a PDF or a PNG, JPEG, TIFF or WebP image.")
+    return "upload" + mimetypes.guess_extension(file_type)
+
+
+async def receive_upload(request):
+    """
+    Reads an upload chunk by chunk, hashing it on the way and moving it to a
+    temporary file once it outgrows SPOOL_MB, so large files are never held whole.
+    Refuses names that are neither a PDF nor an image before reading the body;
+    unnamed uploads are named after their signature, and refused if it is unknown.
+    """
+    filename, chunks = await _upload_stream(request)
+    if filename:
+        file_type = get_file_type(filename) or ""
+        if "pdf" not in file_type and "image" not in file_type:
+            raise web.HTTPUnsupportedMediaType(text=f"Unsupported file type {filename!r}: upload a PDF or an image.")
+    digest = hashlib.sha256()
+    buffer, spool, size = bytearray(), None, 0
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > MAX_UPLOAD_MB * 1024 * 1024:
+                raise web.HTTPRequestEntityTooLarge(max_size=int(MAX_UPLOAD_MB * 1024 * 1024), actual_size=size)
+            digest.update(chunk)
+            if spool is not None:
+                spool.write(chunk)
+                continue
+            buffer += chunk
+            if not filename and len(buffer) >= SNIFF_BYTES:
+                filename = _sniffed_filename(buffer)
+            if size > SPOOL_MB * 1024 * 1024:
+                spool = tempfile.NamedTemporaryFile(prefix="medibot-", suffix=os.path.splitext(filename)[1],
+                                                    delete=False)
+                spool.write(buffer)
+                buffer = None
+    except BaseException:
+        if spool is not None:
+            spool.close()
+            os.unlink(spool.name)
+        raise
+    if size == 0:
+        raise web.HTTPBadRequest(text="Empty upload.")
+    if not filename:
+        filename = _sniffed_filename(buffer)
+
+    key = content_key(digest.hexdigest(), filename)
+    if spool is not None:
+        spool.close()
+        return Upload(None, spool.name, filename, key)
+    return Upload(bytes(buffer), None, filename, key)
+
+
+async def remove_when_done(path, job_id):
+    """
+    Deletes a spooled upload once its job (which may be shared) no longer needs it.
+    """
+    scheduler = get_default_scheduler()
+    while True:
+        job = scheduler.status(job_id)
+        if job is None or job["status"] in FINISHED:
+            break
+        await asyncio.sleep(POLL_S)
+    os.unlink(path)
+
+
+async def open_stream(request):
+    """
+    Starts a streamed response, as server-sent events if the client accepts them
+    and as NDJSON otherwise. Returns send(event, **fields).
+    """
+    sse = "text/event-stream" in request.headers.get("Accept", "")
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream" if sse else "application/x-ndjson",
+        "Cache-Control": "no-cache",
+    })
+    await response.prepare(request)
+
+    async def send(event, **fields):
+        payload = json.dumps({"event": event, **fields}, default=str)
+        await response.write((f"event: {event}\ndata: {payload}\n\n" if sse else f"{payload}\n").encode())
+
+    return response, send
+
+
+async def run_extraction(request, handler):
+    """
+    Receives the upload, queues it on the shared OCR job queue and streams a
+    "queued" event per queue position change and a "page" event per finished
+    page. Then awaits handler(send, pages) for the rest of the response.
+    """
+    upload = await receive_upload(request)
+    scheduler = get_default_scheduler()
+    user = request.headers.get("X-MediBot-User") or request.remote
+    try:
+        job_id = scheduler.submit(user, upload.source, upload.filename, key=upload.key)
+    except QueueFull as e:
+        if upload.path is not None:
+            os.unlink(upload.path)
+        raise web.HTTPTooManyRequests(text=str(e), headers={"Retry-After": "5"})
+
+    job = None
+    try:
+        response, send = await open_stream(request)
+        pages, position = [], None
+        while True:
+            job = scheduler.status(job_id, since=len(pages))
+            for page in job["pages"]:
+                pages.append(page)
+                await send("page", **page)
+            if job["status"] in FINISHED:
+                break
+            if job["position"] is not None and job["position"] != position:
+                position = job["position"]
+                await send("queued", job_id=job_id, position=position)
+            await asyncio.sleep(POLL_S)
+
+        if job["status"] != DONE:
+            await send("error", message=job["error"] or f"Extraction {job['status']}.")
+        else:
+            await handler(send, [page["text"] for page in pages])
+        await response.write_eof()
+        return response
+    finally:
+        if job is None or job["status"] not in FINISHED:
+            # The client went away; stop the job unless other requests share it
+            scheduler.cancel(job_id, user)
+        if upload.path is not None:
+            cleanup = asyncio.ensure_future(remove_when_done(upload.path, job_id))
+            request.app["cleanups"].add(cleanup)
+            cleanup.add_done_callback(request.app["cleanups"].discard)
+
+
+async def extract(request):
+    """
+    POST /extract: streams the extracted text page by page, then a "done" event.
+    """
+    async def finish(send, page_texts):
+        await send("done", pages=len(page_texts), chars=sum(len(text) for text in page_texts))
+
+    return await run_extraction(request, finish)
+
+
+async def analyze(request):
+    """
+    POST /analyze?type=...: streams the pages, the lab values found locally, then
+    the LLM analysis chunk by chunk ("Value Extraction Only" stops at the values).
+    """
+    analysis_type = request.query.get("type", "Full Analysis")
+    if analysis_type != VALUES_ONLY and analysis_type not in prompt_builder.ANALYSIS_INSTRUCTIONS:
+        raise web.HTTPBadRequest(text=f"Unknown analysis type {analysis_type!r}.")
+    provider = request.app["provider"]
+
+    async def finish(send, page_texts):
+        text = "".join(page_texts)
+        records = await asyncio.to_thread(extract_lab_values, text)
+        await send("values", records=records)
+        if analysis_type == VALUES_ONLY or not text.strip():
+            return await send("done", cached=False)
+
+        report_pages = prompt_builder.report_pages(page_texts, records)
+        response_cache = llm_cache.get_default_cache()
+        cache_key = response_cache.make_key(prompt_builder.compact_pages(report_pages),
+                                            prompt_builder.PROMPT_VERSION, analysis_type, GEMINI_MODEL)
+        analysis = await asyncio.to_thread(response_cache.get, cache_key)
+        if analysis is not None:
+            await send("analysis", text=analysis)
+            return await send("done", cached=True)
+
+        start = asyncio.get_running_loop().time()
+        try:
+            # build_prompt runs its own event loop for chunked reports, so it gets a thread
+            prompt, stats = await asyncio.to_thread(
+                prompt_builder.build_prompt, prompt_builder.ANALYSIS_INSTRUCTIONS[analysis_type],
+                report_pages, provider=provider, raw_pages=page_texts)
+            await send("prompt", **stats)
+            chunks = []
+            async for chunk in provider.astream(prompt):
+                chunks.append(chunk)
+                await send("analysis", text=chunk)
+        except llm_providers.LLMError as e:
+            return await send("error", message=f"Error from model: {e}")
+        analysis = "".join(chunks)
+        if analysis:
+            await asyncio.to_thread(response_cache.put, cache_key, analysis, model=GEMINI_MODEL,
+                                    latency_s=asyncio.get_running_loop().time() - start)
+        await send("done", cached=False)
+
+    return await run_extraction(request, finish)
+
+
+async def healthz(request):
+    return web.json_response({"status": "ok", "jobs": get_default_scheduler().stats()})
+
+
+async def metrics(request):
+    """
+    GET /metrics: stage metrics (with MEDIBOT_TRACING=1) and job queue gauges.
+    """
+    jobs = get_default_scheduler().stats()
+    lines = [
+        "# HELP medibot_jobs_queued Extraction jobs waiting for a worker.",
+        "# TYPE medibot_jobs_queued gauge",
+        f"medibot_jobs_queued {jobs['queued']}",
+        "# HELP medibot_jobs_running Extraction jobs in progress.",
+        "# TYPE medibot_jobs_running gauge",
+        f"medibot_jobs_running {jobs['running']}",
+        "# HELP medibot_jobs_total Extraction submissions by outcome.",
+        "# TYPE medibot_jobs_total counter",
+    ]
+    lines += [f'medibot_jobs_total{{outcome="{name}"}} {jobs[name]}' for name in ("submitted", "coalesced", "rejected")]
+    lines += [
+        "# HELP medibot_ocr_pool_restarts_total OCR process pools replaced after a worker died.",
+        "# TYPE medibot_ocr_pool_restarts_total counter",
+        f"medibot_ocr_pool_restarts_total {jobs['pool_restarts']}",
+    ]
+    body = "\n".join(lines) + "\n" + (tracing.export_prometheus() if tracing.enabled else "")
+    return web.Response(text=body, content_type="text/plain", headers={"X-Content-Type-Options": "nosniff"})
+
+
+async def _wait_for_cleanups(app):
+    if app["cleanups"]:
+        await asyncio.gather(*app["cleanups"], return_exceptions=True)
+
+
+def make_app(provider=None):
+    """
+    Builds the service; `provider` defaults to Gemini with GEMINI_API_KEY.
+    """
+    app = web.Application()
+    app["provider"] = provider or llm_providers.get_provider("gemini", GEMINI_API_KEY, model=GEMINI_MODEL)
+    app["cleanups"] = set()
+    app.on_cleanup.append(_wait_for_cleanups)
+    app.router.add_post("/extract", extract)
+    app.router.add_post("/analyze", analyze)
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/metrics", metrics)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP service for MediBot extraction and analysis.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--fake-llm", action="store_true", help="answer with a local fake_llm_server instead of Gemini")
+    parser.add_argument("--fake-latency", type=float, default=0.0, help="seconds the fake LLM takes per response")
+    parser.add_argument("--fake-error-rate", type=float, default=0.0, help="fraction of fake LLM requests that fail")
+    args = parser.parse_args()
+
+    provider = None
+    if args.fake_llm:
+        fake = FakeLLMServer(latency=args.fake_latency, error_rate=args.fake_error_rate).start()
+        print(f"Using the fake LLM server at {fake.url}")
+        provider = llm_providers.get_provider("gemini", "fake-key", model=GEMINI_MODEL, base_url=fake.gemini_url)
+    threading.Thread(target=prewarm, name="prewarm", daemon=True).start()
+    web.run_app(make_app(provider), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import json
+import os
+import subprocess
+import sys
+
+import benchmark
+
+# Cold `import trial` budget; raise it with MEDIBOT_IMPORT_BUDGET_S on slow machines
+IMPORT_BUDGET_S = float(os.environ.get("MEDIBOT_IMPORT_BUDGET_S", "0.5"))
+LAZY_MODULES = ["camelot", "cv2", "pdfplumber", "pdf2image"]
+
+
+def test_import_trial_is_under_budget():
+    total, direct = benchmark.measure_import_time("trial")
+    assert total <= IMPORT_BUDGET_S, f"import trial took {total:.3f}s; slowest direct imports: {direct[:5]}"
+
+
+def test_import_trial_leaves_heavy_modules_unloaded():
+    # A fresh interpreter, as other tests load these modules on purpose
+    code = f"import sys, json, trial; print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert json.loads(out.stdout.strip().splitlines()[-1]) == []
@@ -0,0 +1,42 @@
+import pytest
+
+from lab_values import extract_lab_values, parse_line
+from trial import clean_ocr_output
+
+
+@pytest.mark.parametrize("line, test, value, flag", [
+    ("Hemoglobin 13.5 g/dL 13.0-17.0", "Hemoglobin", 13.5, "N"),
+    ("Hemoglobin 9.8 g/dL 12-17 L", "Hemoglobin", 9.8, "L"),
+    ("LDL Cholesterol 130 mg/dL < 100", "LDL Cholesterol", 130.0, "H"),
+    ("Vitamin D, 25-Hydroxy 18.2 ng/mL", "Vitamin D", 18.2, "L"),
+    ("25-OH Vitamin D 18 ng/mL", "Vitamin D", 18.0, "L"),
+    ("Vitamin D (25-OH) 18 ng/mL 30-100", "Vitamin D", 18.0, "L"),
+    ("Total Leucocyte Count 8,500 /cumm 4000 - 11000", "WBC Count", 8500.0, "N"),
+    ("Total Leucocyte Count 8,500 /cumm 4,000 - 11,000", "WBC Count", 8500.0, "N"),
+    ("Platelet Count 2.50 lakhs/cumm 1.50 - 4.50", "Platelet Count", 2.5, "N"),
+    ("Collected 12/05/2024 10:30 Hemoglobin 11.2 g/dL", "Hemoglobin", 11.2, "L"),
+])
+def test_parse_line(line, test, value, flag):
+    for text in (line, clean_ocr_output(line)):
+        record = parse_line(text)
+        assert (record["test"], record["value"], record["flag"]) == (test, value, flag), text
+
+
+@pytest.mark.parametrize("line", [
+    "Non-HDL Cholesterol 160 mg/dL <130",
+    "LDL/HDL Ratio 3.2",
+    "Hb 12/05/2024",
+    "Patient Name: A. Kumar",
+])
+def test_parse_line_rejects(line):
+    assert parse_line(line) is None
+    assert parse_line(clean_ocr_output(line)) is None
+
+
+def test_grouped_decimal_stays_decimal_for_small_units():
+    assert parse_line("Creatinine 1.025 mg/dL")["value"] == 1.025
+
+
+def test_extract_lab_values_dedupes():
+    text = "Hemoglobin 13.5 g/dL\nHemoglobin 13.5 g/dL\nRDW 13.2 % 11.5-14.5\n"
+    assert [(r["test"], r["value"]) for r in extract_lab_values(text)] == [("Hemoglobin", 13.5), ("RDW", 13.2)]
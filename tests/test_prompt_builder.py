@@ -0,0 +1,37 @@
+import prompt_builder
+from lab_values import extract_lab_values
+
+
+def make_page(number, hemoglobin):
+    return (f"City Lab, Pune\nPatient: A Kumar  Age 45\nHemoglobin {hemoglobin} g/dL 12-17\n"
+            f"Non-HDL Cholesterol 160 mg/dL <130\nPage {number} of 2\nThis is an electronically generated report\n")
+
+
+def test_report_pages_sends_headers_once():
+    pages = [make_page(1, 9.8), make_page(2, 10.1)]
+    text = prompt_builder.compact_pages(prompt_builder.report_pages(pages, extract_lab_values("".join(pages))))
+    assert "Hemoglobin: 9.8 g/dL" in text and "Hemoglobin: 10.1 g/dL" in text
+    assert "Non-HDL Cholesterol 160 mg/dL <130" in text
+    for line in ("City Lab, Pune", "Patient: A Kumar Age 45", "This is an electronically generated report"):
+        assert text.count(line) == 1, line
+    assert "Page 2 of 2" not in text
+
+
+def test_report_pages_without_records_returns_page_texts():
+    pages = ["Impression: normal study\n"]
+    assert prompt_builder.report_pages(pages, []) == pages
+
+
+def test_build_prompt_counts_savings_against_raw_pages():
+    pages = [make_page(1, 9.8), make_page(2, 10.1)]
+    report = prompt_builder.report_pages(pages, extract_lab_values("".join(pages)))
+    instructions = prompt_builder.ANALYSIS_INSTRUCTIONS["Quick Summary"]
+    prompt, stats = prompt_builder.build_prompt(instructions, report, raw_pages=pages)
+    assert stats["raw_tokens"] == prompt_builder.estimate_tokens(prompt_builder.render_prompt(instructions, "".join(pages)))
+    assert stats["compact_tokens"] == stats["prompt_tokens"] == prompt_builder.estimate_tokens(prompt)
+    assert stats["tokens_saved"] == stats["raw_tokens"] - stats["compact_tokens"] > 0
+
+
+def test_compact_pages_keeps_lines_differing_in_value():
+    pages = [f"Hemoglobin {v} g/dL\n" for v in ("13.1", "9.8", "7.2")]
+    assert prompt_builder.compact_pages(pages).splitlines() == [p.strip() for p in pages]
@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import service
+from job_queue import get_default_scheduler
+from trial import sniff_file_type
+
+
+@pytest.mark.parametrize("head, mime_type", [
+    (b"%PDF-1.4\n", "application/pdf"),
+    (b"\x89PNG\r\n\x1a\n\x00\x00\x00\r", "image/png"),
+    (b"\xff\xd8\xff\xe0\x00\x10JFIF", "image/jpeg"),
+    (b"II*\x00\x08\x00\x00\x00", "image/tiff"),
+    (b"RIFF\x24\x00\x00\x00WEBPVP8 ", "image/webp"),
+    (b"pytesseract\npillow\n", None),
+])
+def test_sniff_file_type(head, mime_type):
+    assert sniff_file_type(head) == mime_type
+
+
+def post(path, data):
+    async def run():
+        async with TestClient(TestServer(service.make_app(provider=object()))) as client:
+            response = await client.post(path, data=data)
+            return response.status
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("path, data", [
+    ("/extract?filename=notes.txt", b"%PDF-1.4\n"),
+    ("/extract", b"pytesseract\npillow\n"),
+    ("/analyze", b"ab"),
+])
+def test_unsupported_uploads_are_refused_before_queueing(path, data):
+    submitted = get_default_scheduler().stats()["submitted"]
+    assert post(path, data) == 415
+    assert get_default_scheduler().stats()["submitted"] == submitted
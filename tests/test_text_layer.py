@@ -0,0 +1,61 @@
+import io
+import random
+
+from PIL import Image
+
+import trial
+from bench_corpus import make_report_pages, write_text_pdf
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792
+
+
+def scanned_pdf_with_stamp(stamp):
+    """
+    A one-page PDF whose body is a full-page JPEG (a scan) with a line of real
+    text on top, like a lab system's report ID stamp.
+    """
+    jpeg = io.BytesIO()
+    Image.new("L", (306, 396), 255).save(jpeg, "JPEG")
+    jpeg = jpeg.getvalue()
+    content = (f"q {PAGE_WIDTH} 0 0 {PAGE_HEIGHT} 0 0 cm /Im1 Do Q "
+               f"BT /F1 8 Tf 1 0 0 1 40 770 Tm ({stamp}) Tj ET").encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [4 0 R] /Count 1 >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+        "/Resources << /Font << /F1 3 0 R >> /XObject << /Im1 6 0 R >> >> /Contents 5 0 R >>".encode(),
+        f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream",
+        f"<< /Type /XObject /Subtype /Image /Width 306 /Height 396 /ColorSpace /DeviceGray "
+        f"/BitsPerComponent 8 /Filter /DCTDecode /Length {len(jpeg)} >>\nstream\n".encode() + jpeg + b"\nendstream",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for obj_id, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{obj_id} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def test_scanned_page_with_digital_stamp_needs_ocr():
+    texts, coverage = trial.read_text_layer(scanned_pdf_with_stamp("LabSys Report ID 20240512-0042 Page 1 of 3"))
+    assert sum(c.isalnum() for c in texts[0]) >= trial.min_text_layer_chars
+    assert coverage[0][0] > 0.99
+    assert not trial.has_text_layer(texts[0], *coverage[0])
+
+
+def test_digital_report_keeps_its_text_layer(tmp_path):
+    path = tmp_path / "report.pdf"
+    write_text_pdf(str(path), make_report_pages(random.Random(1), 1))
+    texts, coverage = trial.read_text_layer(str(path))
+    assert coverage[0][0] == 0.0
+    assert trial.has_text_layer(texts[0], *coverage[0])
+
+
+def test_searchable_scan_keeps_its_text_layer():
+    # A scanner's OCR layer covers the body, not just a header
+    assert trial.has_text_layer("Hemoglobin 13.5 g/dL " * 40, image_fraction=1.0, text_fraction=0.2)
@@ -0,0 +1,284 @@
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+
+# Tracing is off unless MEDIBOT_TRACING=1; disabled spans cost one function call.
+# MEDIBOT_TRACE_FILE appends every finished span to a JSON lines file.
+enabled = os.environ.get("MEDIBOT_TRACING", "0") == "1"
+trace_file = os.environ.get("MEDIBOT_TRACE_FILE")
+
+# Numeric span attributes that are also exported as Prometheus counters
+COUNTED_ATTRS = ("pages", "pixels", "bytes", "prompt_tokens", "output_tokens", "tokens_saved", "cpu_s")
+DURATION_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Span:
+    """
+    One timed stage. Attributes can be added while it runs with `set`.
+    "cpu_s" is filled in with the CPU time of the thread that ran it.
+    """
+
+    __slots__ = ("name", "attrs", "trace_id", "span_id", "parent_id", "start", "duration", "status", "_perf_start",
+                 "_cpu_start", "_stack")
+
+    def __init__(self, name, attrs, parent=None):
+        self.name = name
+        self.attrs = attrs
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:8]
+        self.parent_id = parent.span_id if parent else None
+        self.start = time.time()
+        self.duration = None
+        self.status = "ok"
+        self._perf_start = None
+        self._cpu_start = None
+        self._stack = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        # Remember the entering thread's stack: generators may finish on another thread
+        self._stack = _stack()
+        self._stack.append(self)
+        collector.enter(self.name)
+        self._perf_start = time.perf_counter()
+        self._cpu_start = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._perf_start
+        # Thread CPU time only means something if the span ends where it started
+        if self._stack is _stack():
+            self.attrs.setdefault("cpu_s", round(time.thread_time() - self._cpu_start, 6))
+        if exc_type is not None:
+            self.status = "error"
+            self.attrs.setdefault("error", str(exc))
+        if self in self._stack:
+            self._stack.remove(self)
+        collector.leave(self.name)
+        collector.record(self)
+        return False
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_s": round(self.duration, 6) if self.duration is not None else None,
+            "status": self.status,
+            "attrs": self.attrs,
+        }
+
+
+class _NullSpan:
+    """
+    Stand-in used when tracing is disabled; every operation is a no-op.
+    """
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+_local = threading.local()
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+class Collector:
+    """
+    Aggregates finished spans per stage and keeps the most recent ones for JSON export.
+    """
+
+    def __init__(self, max_spans=10000):
+        self._lock = threading.Lock()
+        self.recent = deque(maxlen=max_spans)
+        self.active = defaultdict(int)  # spans currently open per stage
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.recent.clear()
+            self.counts = defaultdict(int)
+            self.errors = defaultdict(int)
+            self.sums = defaultdict(float)
+            self.buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+            self.counters = defaultdict(float)
+
+    def enter(self, name):
+        with self._lock:
+            self.active[name] += 1
+
+    def leave(self, name):
+        with self._lock:
+            self.active[name] -= 1
+
+    def active_stages(self):
+        """
+        Returns the names of stages with a span open right now (on any thread).
+        """
+        with self._lock:
+            return [name for name, n in self.active.items() if n > 0]
+
+    def record(self, span):
+        with self._lock:
+            self.recent.append(span)
+            self.counts[span.name] += 1
+            self.sums[span.name] += span.duration
+            if span.status == "error":
+                self.errors[span.name] += 1
+            buckets = self.buckets[span.name]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if span.duration <= bound:
+                    buckets[i] += 1
+            for attr in COUNTED_ATTRS:
+                value = span.attrs.get(attr)
+                if isinstance(value, (int, float)):
+                    self.counters[(span.name, attr)] += value
+
+        if trace_file:
+            line = json.dumps(span.to_dict(), default=str)
+            with self._lock, open(trace_file, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def export_prometheus(self):
+        """
+        Renders the aggregates in the Prometheus text exposition format.
+        """
+        with self._lock:
+            lines = [
+                "# HELP medibot_stage_duration_seconds Time spent in each pipeline stage.",
+                "# TYPE medibot_stage_duration_seconds histogram",
+            ]
+            for name in sorted(self.counts):
+                for bound, count in zip(DURATION_BUCKETS, self.buckets[name]):
+                    lines.append(f'medibot_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+                lines.append(f'medibot_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {self.counts[name]}')
+                lines.append(f'medibot_stage_duration_seconds_sum{{stage="{name}"}} {self.sums[name]:.6f}')
+                lines.append(f'medibot_stage_duration_seconds_count{{stage="{name}"}} {self.counts[name]}')
+
+            lines += ["# HELP medibot_stage_errors_total Stage runs that raised.",
+                      "# TYPE medibot_stage_errors_total counter"]
+            for name in sorted(self.counts):
+                lines.append(f'medibot_stage_errors_total{{stage="{name}"}} {self.errors[name]}')
+
+            for attr in COUNTED_ATTRS:
+                entries = sorted((name, value) for (name, a), value in self.counters.items() if a == attr)
+                if not entries:
+                    continue
+                lines += [f"# HELP medibot_stage_{attr}_total Total {attr.replace('_', ' ')} processed per stage.",
+                          f"# TYPE medibot_stage_{attr}_total counter"]
+                for name, value in entries:
+                    lines.append(f'medibot_stage_{attr}_total{{stage="{name}"}} {value:g}')
+            return "\n".join(lines) + "\n"
+
+    def export_json(self):
+        """
+        Returns the recent spans as JSON lines, oldest first.
+        """
+        with self._lock:
+            spans = list(self.recent)
+        return "".join(json.dumps(s.to_dict(), default=str) + "\n" for s in spans)
+
+
+collector = Collector()
+
+
+def span(name, **attrs):
+    """
+    Times a stage: `with tracing.span("camelot", pages=3) as s: ... s.set(tables=2)`.
+    Spans nest per thread, so child stages share the trace id of their parent.
+    """
+    if not enabled:
+        return NULL_SPAN
+    stack = _stack()
+    return Span(name, attrs, parent=stack[-1] if stack else None)
+
+
+def record(name, duration, **attrs):
+    """
+    Records a stage that was timed elsewhere, e.g. inside a worker process.
+    """
+    if not enabled:
+        return
+    stack = _stack()
+    s = Span(name, attrs, parent=stack[-1] if stack else None)
+    s.duration = duration
+    s.start = time.time() - duration
+    collector.record(s)
+
+
+def export_prometheus():
+    return collector.export_prometheus()
+
+
+def export_json():
+    return collector.export_json()
+
+
+def rss_mb(pid="self"):
+    """
+    Current resident memory of a process in MB (Linux only; None elsewhere).
+    """
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class MemorySampler(threading.Thread):
+    """
+    Samples the resident memory of this process and its OCR worker processes,
+    keeping the overall peaks and, per stage, the peak seen while it was running.
+    """
+
+    def __init__(self, interval=0.05):
+        super().__init__(name="memory-sampler", daemon=True)
+        self.interval = interval
+        self.peak_mb = None
+        self.peak_workers_mb = None
+        self.stage_peak_mb = defaultdict(float)
+        self._stop_event = threading.Event()
+
+    def sample(self):
+        """
+        Takes one reading; returns False where resident memory can't be read.
+        """
+        own = rss_mb()
+        if own is None:
+            return False
+        workers = sum(rss_mb(child.pid) or 0 for child in multiprocessing.active_children())
+        self.peak_mb = max(self.peak_mb or 0, own)
+        self.peak_workers_mb = max(self.peak_workers_mb or 0, workers)
+        for stage in collector.active_stages():
+            self.stage_peak_mb[stage] = max(self.stage_peak_mb[stage], own + workers)
+        return True
+
+    def run(self):
+        # Sample right away too, so even a short run gets a reading
+        while self.sample() and not self._stop_event.wait(self.interval):
+            pass
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
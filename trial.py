@@ -1,29 +1,86 @@
+import io
+import math
 import os
-import pytesseract
+import re
+import tempfile
+import time
+from contextlib import contextmanager
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from PIL import Image
-import pdfplumber
-from pdf2image import convert_from_path
 import mimetypes
-import cv2
 import numpy as np
-import camelot
+from lazy_imports import lazy_module, prewarm as prewarm_modules
+from ocr_cache import get_default_cache
+import ocr_engine
+import tracing
+from prompt_builder import serialize_table
+
+# Heavy dependencies load on first use (Camelot alone pulls in pandas and a PDF
+# stack), so image-only requests and CLI tools start fast; see prewarm()
+pytesseract = lazy_module("pytesseract")
+pdfplumber = lazy_module("pdfplumber")
+pdf2image = lazy_module("pdf2image")
+cv2 = lazy_module("cv2")
+camelot = lazy_module("camelot")
 
 # If using Windows, set tesseract path
-<<<<<<< HEAD
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-=======
 # pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
->>>>>>> 9eebbe4
 
 # Global Tesseract config with whitelist for numbers, decimals, units
 custom_config = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ.,:/-()% '
 
-<<<<<<< HEAD
-# Set Gemini API key for use in other modules
-os.environ["GEMINI_API_KEY"] = "_______________________"
+# Rasterization DPI for scanned PDFs and upscale factor applied before OCR
+ocr_dpi = 400
+ocr_scale_percent = 200
+
+# "fixed" renders every scanned page at ocr_dpi and upscales by ocr_scale_percent;
+# "adaptive" measures the glyph height on a cheap probe render and picks both per page
+raster_mode = os.environ.get("MEDIBOT_RASTER_MODE", "fixed")
+probe_dpi = 100
+min_adaptive_dpi = 150
+# Median character height (px) adaptive mode aims for; Tesseract reads best around
+# a 20-30 px x-height and loses accuracy below ~10 px
+target_glyph_px = 25
+
+# "page" OCRs the whole preprocessed page; "regions" detects text blocks and
+# OCRs only those, skipping margins, blank space and graphics
+ocr_layout = os.environ.get("MEDIBOT_OCR_LAYOUT", "page")
+
+# Skip blank scanned pages, judged on the probe_dpi render
+skip_blank_pages = os.environ.get("MEDIBOT_SKIP_BLANK_PAGES", "1") == "1"
+# Reuse the OCR text of an earlier identical page. Opt-in: candidates found on the
+# probe render are confirmed pixel by pixel at full DPI, but a wrong match would
+# silently copy another page's values
+dedupe_pages = os.environ.get("MEDIBOT_DEDUPE_PAGES", "0") == "1"
+# A page is blank below this ink fraction when it also has fewer than 5 glyph-sized marks
+blank_ink_density = 0.001
+# Max differing dHash bits (of 256) for two pages to be compared in detail
+dedupe_hash_distance = 10
+
+# Bump whenever preprocessing or serialization changes the extracted text, so cached results are not reused
+preprocess_version = 2
+
+# Minimum letters/digits in a page's native text layer for it to skip OCR
+min_text_layer_chars = 20
+# A page with images over this fraction of its area is a scan, even when a digital
+# stamp or header/footer gives it some text, unless its text covers at least
+# min_text_area_fraction of the page (e.g. a scanner's own searchable OCR layer)
+scan_image_fraction = 0.5
+min_text_area_fraction = 0.02
+
+# Number of worker processes used to OCR scanned PDF pages (1 = one page after another)
+ocr_workers = int(os.environ.get("MEDIBOT_OCR_WORKERS", "1"))
+
+# Pages rendered and OCR'd together; caps memory at one window of full-DPI renders
+page_window = int(os.environ.get("MEDIBOT_PAGE_WINDOW", "4"))
+
+# Threads OCR'ing one page's regions at once in the main process. Worker processes
+# use one, as the pool already runs a page per CPU
+region_threads = int(os.environ.get("MEDIBOT_REGION_THREADS", "4"))
+_in_ocr_worker = False  # set by init_ocr_worker
 
-=======
->>>>>>> 9eebbe4
 def clean_ocr_output(text):
     """
     Correct common OCR mistakes in medical reports.
@@ -32,12 +89,40 @@ def clean_ocr_output(text):
     # Adjust further based on real OCR mistakes in your data
     return text
 
-def preprocess_image(image_path, resize=True, scale_percent=200):
+def load_grayscale(image):
+    """
+    Loads an image as a single-channel OpenCV array.
+    Accepts a file path, raw encoded bytes, a PIL image or a NumPy array, so pages
+    can be handed over in memory instead of being written to disk first.
+    """
+    if isinstance(image, np.ndarray):
+        if image.ndim == 2:
+            return image
+        code = cv2.COLOR_BGRA2GRAY if image.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+        return cv2.cvtColor(image, code)
+
+    if isinstance(image, Image.Image):
+        # pdf2image renders "L" pages directly, which NumPy wraps without re-encoding
+        if image.mode != "L":
+            image = image.convert("L")
+        return np.asarray(image)
+
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        gray = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_GRAYSCALE)
+    else:
+        gray = cv2.imread(os.fspath(image), cv2.IMREAD_GRAYSCALE)
+
+    if gray is None:
+        raise ValueError("Could not decode image.")
+    return gray
+
+def preprocess_image(image, resize=True, scale_percent=None):
     """
     Preprocesses image with contrast enhancement, optional resizing, and Gaussian blur.
+    `image` may be a path, encoded bytes, a PIL image or a NumPy array.
     """
-    img = cv2.imread(image_path)
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    gray = load_grayscale(image)
+    scale_percent = ocr_scale_percent if scale_percent is None else scale_percent
 
     # Increase contrast using convertScaleAbs instead of histogram equalization
     alpha = 1.5  # Contrast control
@@ -55,59 +140,605 @@ def preprocess_image(image_path, resize=True, scale_percent=200):
 
     return gray
 
-def extract_text_from_image(image_path):
+def estimate_glyph_height(gray):
+    """
+    Estimates the dominant glyph height in pixels as the median height of
+    character-sized connected components. Returns None if too few are found.
+    """
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+
+    # Drop specks, rules, boxes and merged blobs
+    keep = (heights >= 3) & (heights <= max(3, gray.shape[0] // 20)) & (widths <= heights * 3)
+    heights = heights[keep]
+    if heights.size < 20:
+        return None
+    return float(np.median(heights))
+
+def choose_raster_settings(glyph_px, source_dpi):
+    """
+    Picks the render DPI and upscale that bring glyphs measured at `source_dpi`
+    to about target_glyph_px, preferring a lower DPI over upscaling.
+    Falls back to the fixed settings when the glyph height is unknown.
+    """
+    if not glyph_px:
+        return {"mode": "adaptive", "glyph_px": None, "dpi": ocr_dpi,
+                "scale_percent": ocr_scale_percent, "effective_glyph_px": None}
+
+    needed_dpi = target_glyph_px * source_dpi / glyph_px
+    if needed_dpi <= ocr_dpi:
+        dpi = min(ocr_dpi, max(min_adaptive_dpi, int(math.ceil(needed_dpi / 50.0)) * 50))
+        scale_percent = 100
+    else:
+        dpi = ocr_dpi
+        scale_percent = min(ocr_scale_percent, int(math.ceil(100 * needed_dpi / ocr_dpi)))
+
+    return {
+        "mode": "adaptive",
+        "glyph_px": round(glyph_px, 1),
+        "dpi": dpi,
+        "scale_percent": scale_percent,
+        "effective_glyph_px": round(glyph_px * dpi / source_dpi * scale_percent / 100, 1),
+    }
+
+def extract_text_from_image(image, report=None):
     """
     Extracts text from image with optimized pre-processing and cleaning.
+    In adaptive raster mode the upscale is chosen from the measured glyph height.
+    If `report` is a dict, the per-page decisions are appended to report["pages"].
     """
-    preprocessed_img = preprocess_image(image_path, resize=True)
+    page_report = {"page": 1, "route": "ocr"}
+    scale_percent = ocr_scale_percent
+    if raster_mode == "adaptive":
+        image = load_grayscale(image)
+        # Treat the image's own resolution as the source; only ever upscale
+        decision = choose_raster_settings(estimate_glyph_height(image), ocr_dpi)
+        scale_percent = decision["scale_percent"]
+        print(f"Image: glyph height {decision['glyph_px']}px -> scale {scale_percent}%")
+        page_report.update(mode="adaptive", glyph_px=decision["glyph_px"], scale_percent=scale_percent)
+
+    with tracing.span("preprocess") as span:
+        preprocessed_img = preprocess_image(image, resize=True, scale_percent=scale_percent)
+        span.set(pixels=preprocessed_img.size)
 
     # Save preprocessed image for debugging (optional)
     # cv2.imwrite("debug_preprocessed.png", preprocessed_img)
 
-    text = pytesseract.image_to_string(preprocessed_img, config=custom_config)
+    with tracing.span("tesseract", pixels=preprocessed_img.size, pages=1):
+        text, layout_info = ocr_page_image(preprocessed_img)
+    page_report.update(layout_info)
+    if report is not None:
+        report.setdefault("pages", []).append(page_report)
+
     text = clean_ocr_output(text)
     return text
 
-def extract_tables_from_pdf(pdf_path):
+def detect_text_regions(gray, max_width=1200):
+    """
+    Finds text and table regions with morphology on a downscaled copy of the page.
+    Characters are dilated into lines, graphics (dense ink blobs) are dropped, and
+    lines less than two glyph heights apart are merged into full-width bands so the
+    line structure of tables survives. Returns (x, y, w, h) boxes top to bottom,
+    in `gray` coordinates.
+    """
+    scale = min(1.0, max_width / float(gray.shape[1]))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+    _, binary = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+
+    glyph = estimate_glyph_height(small) or 10.0
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(3, int(glyph * 1.5)), max(1, int(glyph * 0.3))))
+    lines = cv2.dilate(binary, kernel, iterations=1)
+    contours, _ = cv2.findContours(lines, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    blocks = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if h < glyph * 0.5 or w < glyph:
+            continue  # specks and stray marks
+        ink = cv2.countNonZero(binary[y:y + h, x:x + w]) / float(w * h)
+        if h > glyph * 3 and ink > 0.45:
+            continue  # logos, photos, filled boxes
+        blocks.append((x, y, x + w, y + h))
+
+    # Merge vertically overlapping or nearby blocks into bands, top to bottom
+    bands = []
+    for x0, y0, x1, y1 in sorted(blocks, key=lambda b: b[1]):
+        if bands and y0 <= bands[-1][3] + 2 * glyph:
+            bx0, by0, bx1, by1 = bands[-1]
+            bands[-1] = (min(bx0, x0), by0, max(bx1, x1), max(by1, y1))
+        else:
+            bands.append((x0, y0, x1, y1))
+
+    pad = glyph * 0.5
+    height, width = gray.shape[:2]
+    boxes = []
+    for x0, y0, x1, y1 in bands:
+        x0 = max(0, int((x0 - pad) / scale))
+        y0 = max(0, int((y0 - pad) / scale))
+        x1 = min(width, int((x1 + pad) / scale) + 1)
+        y1 = min(height, int((y1 + pad) / scale) + 1)
+        boxes.append((x0, y0, x1 - x0, y1 - y0))
+    return boxes
+
+def ocr_page_image(gray):
+    """
+    OCRs a preprocessed page, either whole or region by region depending on ocr_layout.
+    Returns (text, info) where info holds the region count and skipped pixel fraction.
+    """
+    if ocr_layout != "regions":
+        return ocr_engine.image_to_string(gray, config=custom_config), {}
+
+    boxes = detect_text_regions(gray)
+    if not boxes:
+        # Nothing text-like found; don't risk dropping the page
+        return ocr_engine.image_to_string(gray, config=custom_config), {"regions": 0, "skipped_fraction": 0.0}
+
+    crops = [gray[y:y + h, x:x + w] for x, y, w, h in boxes]
+    ocr_crop = partial(ocr_engine.image_to_string, config=custom_config)
+    threads = 1 if _in_ocr_worker else min(len(crops), region_threads, ocr_engine.DEFAULT_POOL_SIZE)
+    if threads > 1:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            texts = list(executor.map(ocr_crop, crops))
+    else:
+        texts = [ocr_crop(crop) for crop in crops]
+
+    covered = sum(w * h for _, _, w, h in boxes)
+    skipped = 1.0 - covered / float(gray.shape[0] * gray.shape[1])
+    return "\n".join(t.strip("\n") for t in texts), {"regions": len(boxes), "skipped_fraction": round(skipped, 3)}
+
+@contextmanager
+def pdf_on_disk(pdf):
+    """
+    Yields a filesystem path for a PDF given as a path or raw bytes.
+    Camelot can only read from disk, so bytes are spooled to a uniquely named
+    temp file that is removed afterwards.
+    """
+    if not isinstance(pdf, (bytes, bytearray)):
+        yield pdf
+        return
+
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf)
+        yield path
+    finally:
+        os.remove(path)
+
+def render_pdf_pages(pdf, dpi=None, first_page=None, last_page=None):
+    """
+    Renders PDF pages (path or raw bytes) to grayscale PIL images in memory.
+    `first_page`/`last_page` (1-based, inclusive) limit rendering to a page range.
+    """
+    dpi = ocr_dpi if dpi is None else dpi
+    with tracing.span("rasterize", dpi=dpi) as span:
+        if isinstance(pdf, (bytes, bytearray)):
+            images = pdf2image.convert_from_bytes(bytes(pdf), dpi=dpi, grayscale=True,
+                                        first_page=first_page, last_page=last_page)
+        else:
+            images = pdf2image.convert_from_path(pdf, dpi=dpi, grayscale=True,
+                                       first_page=first_page, last_page=last_page)
+        span.set(pages=len(images), pixels=sum(img.width * img.height for img in images))
+    return images
+
+def extract_tables_from_pdf(pdf, pages='all'):
     """
     Uses Camelot to extract tables from PDFs (works only for text-based PDFs).
     Returns list of DataFrame tables.
     """
-    tables = camelot.read_pdf(pdf_path, pages='all', flavor='stream')  # 'stream' works better for lab reports
+    with tracing.span("camelot") as span, pdf_on_disk(pdf) as pdf_path:
+        tables = camelot.read_pdf(pdf_path, pages=pages, flavor='stream')  # 'stream' works better for lab reports
+        if pages != 'all':
+            span.set(pages=len(pages.split(",")))
+        span.set(tables=tables.n)
     return tables
 
-def extract_text_from_pdf(pdf_path):
+# Glyphs without a unicode mapping come out of pdfplumber as "(cid:123)"
+_CID_PATTERN = re.compile(r"\(cid:\d+\)")
+
+def _area_fraction(boxes, page):
+    """
+    Fraction of the page covered by (x0, top, x1, bottom) boxes, clipped to the page.
+    Overlaps are counted twice, so the result is capped at 1.
+    """
+    area = 0.0
+    for x0, top, x1, bottom in boxes:
+        width = min(x1, page.width) - max(x0, 0)
+        height = min(bottom, page.height) - max(top, 0)
+        if width > 0 and height > 0:
+            area += width * height
+    return min(1.0, area / (page.width * page.height)) if page.width and page.height else 0.0
+
+def read_text_layer(pdf):
+    """
+    Reads the native text layer of every PDF page with pdfplumber.
+    Returns (texts, coverage): one string per page ("" when the page has no text
+    layer), and per page the fractions of its area covered by images and by text.
+    """
+    source = io.BytesIO(pdf) if isinstance(pdf, (bytes, bytearray)) else pdf
+    texts, coverage = [], []
+    with tracing.span("text_layer") as span, pdfplumber.open(source) as doc:
+        for page in doc.pages:
+            texts.append(page.extract_text() or "")
+            coverage.append((
+                _area_fraction([(i["x0"], i["top"], i["x1"], i["bottom"]) for i in page.images], page),
+                _area_fraction([(c["x0"], c["top"], c["x1"], c["bottom"]) for c in page.chars], page),
+            ))
+        span.set(pages=len(texts))
+    return texts, coverage
+
+def has_text_layer(page_text, image_fraction=0.0, text_fraction=1.0):
+    """
+    Decides whether a page's native text is usable, i.e. the page needs no OCR.
+    A page mostly covered by images only counts if its text covers enough of it.
+    """
+    usable = _CID_PATTERN.sub("", page_text)
+    if sum(c.isalnum() for c in usable) < min_text_layer_chars:
+        return False
+    return image_fraction < scan_image_fraction or text_fraction >= min_text_area_fraction
+
+def page_runs(page_numbers):
+    """
+    Groups sorted page numbers into (first, last) runs of consecutive pages.
+    """
+    runs = []
+    for n in page_numbers:
+        if runs and runs[-1][1] == n - 1:
+            runs[-1] = (runs[-1][0], n)
+        else:
+            runs.append((n, n))
+    return runs
+
+def render_probe_pages(pdf, page_numbers):
+    """
+    Renders pages at the cheap probe_dpi as grayscale arrays, keyed by page number.
+    """
+    probes = {}
+    for first, last in page_runs(page_numbers):
+        rendered = render_pdf_pages(pdf, dpi=probe_dpi, first_page=first, last_page=last)
+        probes.update((n, load_grayscale(img)) for n, img in zip(range(first, last + 1), rendered))
+    return probes
+
+def plan_rasterization(page_numbers, probes=None):
+    """
+    Chooses the render DPI and upscale for each scanned page.
+    Returns {page_number: decision}; adaptive mode measures glyphs on the probe renders.
+    """
+    if raster_mode != "adaptive":
+        return {n: {"mode": "fixed", "dpi": ocr_dpi, "scale_percent": ocr_scale_percent}
+                for n in page_numbers}
+
+    plans = {}
+    for n in page_numbers:
+        plans[n] = choose_raster_settings(estimate_glyph_height(probes[n]), probe_dpi)
+        print(f"Page {n}: glyph height {plans[n]['glyph_px']}px at {probe_dpi} DPI -> "
+              f"render {plans[n]['dpi']} DPI, scale {plans[n]['scale_percent']}%")
+    return plans
+
+def page_fingerprint(gray, width=600, cell=25):
+    """
+    Summarizes a page for blank/duplicate detection: a 256-bit difference hash,
+    the ink density, the number of glyph-sized marks and an ink-per-cell grid.
+    """
+    small = cv2.resize(gray, (width, max(cell, gray.shape[0] * width // gray.shape[1])),
+                       interpolation=cv2.INTER_AREA)
+    ink = (small < 160).astype(np.uint8)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+
+    tiny = cv2.resize(gray, (17, 16), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = (tiny[:, 1:] > tiny[:, :-1]).flatten()
+
+    rows = ink.shape[0] // cell
+    grid = ink[:rows * cell].reshape(rows, cell, width // cell, cell).sum(axis=(1, 3), dtype=np.int32)
+    return {
+        "dhash": int("".join("1" if b else "0" for b in bits), 2),
+        "ink_density": float(ink.mean()),
+        "marks": int(np.count_nonzero(stats[1:, cv2.CC_STAT_HEIGHT] >= 3)),
+        "grid": grid,
+    }
+
+def is_blank_page(fingerprint):
+    """
+    True when a page has (almost) no ink and nothing that looks like a glyph.
+    """
+    return fingerprint["ink_density"] < blank_ink_density and fingerprint["marks"] < 5
+
+def is_duplicate_page(a, b, cell=25):
+    """
+    True when two fingerprints may describe the same page content: the hash
+    preselects candidates and every cell's ink must match to within 1%. This is
+    too coarse to tell "4.5" from "4.6", so matches are confirmed with
+    pages_identical on full-DPI renders before any text is reused.
+    """
+    if bin(a["dhash"] ^ b["dhash"]).count("1") > dedupe_hash_distance:
+        return False
+    if a["grid"].shape != b["grid"].shape:
+        return False
+    return int(np.abs(a["grid"] - b["grid"]).max()) <= cell * cell // 100
+
+def pages_identical(a, b):
+    """
+    True when two full-DPI renders have the same ink everywhere, ignoring specks of
+    at most 2 differing pixels. Any differing glyph stroke, however small, makes them differ.
+    """
+    a, b = load_grayscale(a), load_grayscale(b)
+    if a.shape != b.shape:
+        return False
+    diff = ((a < 160) != (b < 160)).astype(np.uint8)
+    if not diff.any():
+        return True
+    _, _, stats, _ = cv2.connectedComponentsWithStats(diff, connectivity=8)
+    return bool((stats[1:, cv2.CC_STAT_AREA] <= 2).all())
+
+def confirm_duplicates(pdf, duplicates):
+    """
+    Keeps only the {page: original} candidates whose full-DPI renders are identical.
+    """
+    with tracing.span("dedupe_confirm", pages=len(duplicates)) as span:
+        confirmed = {}
+        for n, original in duplicates.items():
+            page = render_pdf_pages(pdf, dpi=ocr_dpi, first_page=n, last_page=n)[0]
+            first = render_pdf_pages(pdf, dpi=ocr_dpi, first_page=original, last_page=original)[0]
+            if pages_identical(page, first):
+                confirmed[n] = original
+        span.set(confirmed=len(confirmed))
+    return confirmed
+
+def find_skippable_pages(probes, unique=None):
+    """
+    Finds blank pages and likely repeats of earlier pages among probe renders.
+    `unique` is a list of (page, fingerprint) seen so far; it is extended in place
+    so duplicates can be found across page windows.
+    Returns (blank page numbers, {candidate duplicate page: first page with that content});
+    the candidates still need confirm_duplicates.
+    """
+    with tracing.span("dedupe", pages=len(probes)) as span:
+        blank, duplicates = _find_skippable_pages(probes, [] if unique is None else unique)
+        span.set(blank=len(blank), duplicates=len(duplicates))
+    return blank, duplicates
+
+def _find_skippable_pages(probes, unique):
+    blank, duplicates = [], {}
+    for n in sorted(probes):
+        fingerprint = page_fingerprint(probes[n])
+        if is_blank_page(fingerprint):
+            blank.append(n)
+            continue
+        original = next((m for m, f in unique if is_duplicate_page(fingerprint, f)), None)
+        if original is not None:
+            duplicates[n] = original
+        else:
+            unique.append((n, fingerprint))
+    return blank, duplicates
+
+def render_planned_pages(pdf, page_numbers, plans):
+    """
+    Renders pages at their planned DPI, batching consecutive pages that share a DPI.
+    Returns the images in the order of `page_numbers`.
+    """
+    images = {}
+    for dpi in sorted({plans[n]["dpi"] for n in page_numbers}):
+        same_dpi = [n for n in page_numbers if plans[n]["dpi"] == dpi]
+        for first, last in page_runs(same_dpi):
+            rendered = render_pdf_pages(pdf, dpi=dpi, first_page=first, last_page=last)
+            images.update(zip(range(first, last + 1), rendered))
+    return [images[n] for n in page_numbers]
+
+def count_pdf_pages(pdf):
+    """
+    Returns the number of pages in a PDF (path or raw bytes) using poppler's pdfinfo.
+    """
+    if isinstance(pdf, (bytes, bytearray)):
+        return int(pdf2image.pdfinfo_from_bytes(bytes(pdf))["Pages"])
+    return int(pdf2image.pdfinfo_from_path(pdf)["Pages"])
+
+def format_tables(tables, first_idx=1):
+    """
+    Serializes Camelot tables under numbered "--- Table N ---" headers,
+    one "cell | cell" line per row.
+    """
     text = ""
+    for idx, table in enumerate(tables, start=first_idx):
+        text += f"--- Table {idx} ---\n"
+        text += serialize_table(table.df.values.tolist()) + "\n"
+    return text
 
-    # First, try Camelot table extraction for text-based PDFs
+def iter_pdf_pages(pdf, workers=None, report=None, window=None, executor=None):
+    """
+    Extracts a PDF page by page and yields {"page", "page_count", "text", "route", ...}
+    dicts in page order as soon as each page is done.
+    Pages with a usable text layer go through native extraction (Camelot tables,
+    else pdfplumber text); only image-only pages are rasterized and OCR'd.
+    Pages are processed `window` at a time (default page_window), so at most one
+    window of full-DPI renders is held in memory.
+    `pdf` may be a path or the raw file bytes.
+    `workers` sets how many processes OCR pages concurrently (defaults to ocr_workers).
+    `executor` is an externally owned process pool to OCR on instead (e.g. the job
+    scheduler's shared one); it is left running afterwards.
+    If `report` is a dict, per-page decisions go to report["pages"] and skipped
+    pages to report["skipped_pages"].
+    """
+    window = max(1, window or page_window)
     try:
-        tables = camelot.read_pdf(pdf_path, pages='all', flavor='stream')
-        if tables and tables.n > 0:
-            print(f"Found {tables.n} tables using Camelot.")
-            for idx, table in enumerate(tables):
-                text += f"--- Table {idx+1} ---\n"
-                text += table.df.to_string(index=False) + "\n"
-            return text  # Return table extraction as priority
+        page_texts, coverage = read_text_layer(pdf)
     except Exception as e:
-        print(f"Camelot extraction failed: {e}")
-
-    # Fallback to OCR for scanned PDFs
-    images = convert_from_path(pdf_path, dpi=400)
-    for i, img_page in enumerate(images):
-        temp_image_path = f"temp_page_{i}.png"
-        img_page.save(temp_image_path)
-        preprocessed = preprocess_image(temp_image_path, resize=True)
-        
-        # Save preprocessed image for debugging (optional)
-        # cv2.imwrite(f"debug_preprocessed_page_{i}.png", preprocessed)
-        
-        page_text = pytesseract.image_to_string(preprocessed, config=custom_config)
-        text += clean_ocr_output(page_text) + "\n"
-
-        # Cleanup temp image file
-        os.remove(temp_image_path)
+        # Unreadable structure: treat the whole document as a scan
+        print(f"pdfplumber could not read the text layer: {e}")
+        page_texts = [""] * count_pdf_pages(pdf)
+        coverage = [(0.0, 0.0)] * len(page_texts)
 
-    return text
+    page_count = len(page_texts)
+    is_text_page = [has_text_layer(text, *fractions) for text, fractions in zip(page_texts, coverage)]
+    print(f"Page routing: {sum(is_text_page)} with text layer, {page_count - sum(is_text_page)} scanned.")
+
+    workers = ocr_workers if workers is None else workers
+    own_executor = executor is None
+    if own_executor and workers > 1 and not all(is_text_page):
+        print(f"OCR'ing scanned pages with {workers} worker processes.")
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_ocr_worker)
+
+    # Native extraction for digital pages; tables take priority over plain text.
+    # Camelot parses the whole PDF per call, and text pages need no rendering, so
+    # all of them go in one call rather than one per window
+    tables_by_page = {}
+    all_text_pages = [n for n in range(1, page_count + 1) if is_text_page[n - 1]]
+    if all_text_pages:
+        try:
+            tables = extract_tables_from_pdf(pdf, pages=",".join(map(str, all_text_pages)))
+            for table in tables:
+                tables_by_page.setdefault(int(table.page), []).append(table)
+        except Exception as e:
+            print(f"Camelot extraction failed: {e}")
+
+    seen_fingerprints, outputs = [], {}
+    blank_pages, duplicate_pages = [], {}
+    ocr_seconds, ocr_count = 0.0, 0
+    table_idx = 1
+
+    try:
+        for first in range(1, page_count + 1, window):
+            pages = list(range(first, min(first + window, page_count + 1)))
+            text_pages = [n for n in pages if is_text_page[n - 1]]
+            scan_pages = [n for n in pages if not is_text_page[n - 1]]
+            decisions = {n: {"route": "text"} for n in text_pages}
+
+            for n in text_pages:
+                if n in tables_by_page:
+                    page_tables = tables_by_page.pop(n)  # released as its window is yielded
+                    outputs[n] = format_tables(page_tables, first_idx=table_idx)
+                    table_idx += len(page_tables)
+                else:
+                    outputs[n] = page_texts[n - 1] + "\n"
+
+            # Scanned pages: drop blanks and repeats, then OCR the rest
+            ocr_pages, plans = [], {}
+            if scan_pages:
+                probes = None
+                if skip_blank_pages or dedupe_pages or raster_mode == "adaptive":
+                    probes = render_probe_pages(pdf, scan_pages)
+
+                blank, duplicates = ([], {})
+                if skip_blank_pages or dedupe_pages:
+                    blank, duplicates = find_skippable_pages(probes, seen_fingerprints)
+                    if not skip_blank_pages:
+                        blank = []
+                    duplicates = confirm_duplicates(pdf, duplicates) if dedupe_pages else {}
+                blank_pages.extend(blank)
+                duplicate_pages.update(duplicates)
+                for n in blank:
+                    outputs[n] = ""
+                    decisions[n] = {"route": "blank"}
+                for n, original in duplicates.items():
+                    decisions[n] = {"route": "duplicate", "duplicate_of": original}
+
+                ocr_pages = [n for n in scan_pages if n not in blank and n not in duplicates]
+                plans = plan_rasterization(ocr_pages, probes)
+
+            ocr_results = iter_ocr_pdf_pages(
+                render_planned_pages(pdf, ocr_pages, plans), page_numbers=ocr_pages,
+                scale_percents=[plans[n]["scale_percent"] for n in ocr_pages], executor=executor)
+
+            for n in pages:
+                if n in plans:
+                    start = time.perf_counter()
+                    _, page_text, layout_info = next(ocr_results)
+                    ocr_seconds += time.perf_counter() - start
+                    outputs[n] = page_text + "\n"
+                    decisions[n] = dict(plans[n], route="ocr", **layout_info)
+                    ocr_count += 1
+                elif n in duplicate_pages:
+                    # The original is an earlier page, so its text is already known
+                    outputs[n] = outputs[duplicate_pages[n]]
+
+                page = dict(decisions[n], page=n)
+                if report is not None:
+                    report.setdefault("pages", []).append(page)
+                yield dict(page, page_count=page_count, text=outputs[n])
+    finally:
+        if own_executor and executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    if blank_pages or duplicate_pages:
+        seconds_per_page = ocr_seconds / ocr_count if ocr_count else 0.0
+        seconds_saved = round(seconds_per_page * (len(blank_pages) + len(duplicate_pages)), 2)
+        print(f"Skipped blank pages {blank_pages}, reused OCR for duplicate pages "
+              f"{sorted(duplicate_pages)} (~{seconds_saved}s saved).")
+        if report is not None:
+            report["skipped_pages"] = {
+                "blank": blank_pages,
+                "duplicates": duplicate_pages,
+                "estimated_seconds_saved": seconds_saved,
+            }
+
+def extract_text_from_pdf(pdf, workers=None, report=None):
+    """
+    Extracts the whole text of a PDF; see iter_pdf_pages for how pages are handled.
+    """
+    return "".join(page["text"] for page in iter_pdf_pages(pdf, workers=workers, report=report))
+
+def cpu_time():
+    """
+    CPU seconds used by this process and its finished child processes (tesseract runs).
+    """
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+def ocr_pdf_page(page_number, img_page, scale_percent=None):
+    """
+    Preprocesses and OCRs a single rendered PDF page, returning (text, layout info).
+    Top-level so it can run inside worker processes; stage timings are returned in
+    the info (preprocess_s, ocr_s and their CPU time) and recorded by the parent.
+    """
+    start, cpu_start = time.perf_counter(), cpu_time()
+    preprocessed = preprocess_image(img_page, resize=scale_percent != 100, scale_percent=scale_percent)
+    preprocess_s, preprocess_cpu_s = time.perf_counter() - start, cpu_time() - cpu_start
+
+    # Save preprocessed image for debugging (optional)
+    # cv2.imwrite(f"debug_preprocessed_page_{page_number}.png", preprocessed)
+
+    start, cpu_start = time.perf_counter(), cpu_time()
+    page_text, layout_info = ocr_page_image(preprocessed)
+    page_text = clean_ocr_output(page_text)
+    layout_info.update(pixels=preprocessed.size, preprocess_s=round(preprocess_s, 4),
+                       ocr_s=round(time.perf_counter() - start, 4),
+                       preprocess_cpu_s=round(preprocess_cpu_s, 4), ocr_cpu_s=round(cpu_time() - cpu_start, 4))
+    return page_text, layout_info
+
+def iter_ocr_pdf_pages(images, page_numbers=None, scale_percents=None, executor=None):
+    """
+    OCRs rendered PDF pages and returns an iterator of (page number, text, layout info)
+    in page order. With an `executor` all pages are submitted immediately and run
+    concurrently while earlier results are consumed.
+    """
+    page_numbers = page_numbers or list(range(1, len(images) + 1))
+    scale_percents = scale_percents or [None] * len(images)
+    if executor is None:
+        tasks = [(n, partial(ocr_pdf_page, n, img_page, scale_percent))
+                 for n, img_page, scale_percent in zip(page_numbers, images, scale_percents)]
+    else:
+        tasks = [(n, executor.submit(ocr_pdf_page, n, img_page, scale_percent).result)
+                 for n, img_page, scale_percent in zip(page_numbers, images, scale_percents)]
+    return collect_ocr_results(tasks)
+
+def collect_ocr_results(tasks):
+    """
+    Runs/awaits (page number, callable) tasks in order. A page that fails is replaced
+    by a short error marker so the rest of the document is still returned; a dead
+    worker process is raised instead, as the pool can't OCR anything after it.
+    """
+    for n, run in tasks:
+        try:
+            text, info = run()
+            tracing.record("preprocess", info["preprocess_s"], pixels=info["pixels"], cpu_s=info["preprocess_cpu_s"])
+            tracing.record("tesseract", info["ocr_s"], pixels=info["pixels"], pages=1, cpu_s=info["ocr_cpu_s"])
+            yield n, text, info
+        except BrokenProcessPool:
+            raise
+        except Exception as e:
+            print(f"OCR failed on page {n}: {e}")
+            yield n, f"[Page {n}: OCR failed]", {"error": str(e)}
 
 def get_file_type(file_path):
     """
@@ -116,24 +747,151 @@ def get_file_type(file_path):
     mime_type, _ = mimetypes.guess_type(file_path)
     return mime_type
 
-def extract_text(file_path):
+# File signatures of the formats extract_text reads
+_SIGNATURES = [
+    (b"%PDF-", "application/pdf"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+]
+
+def sniff_file_type(data):
     """
-    Main function to extract text based on file type (PDF or image).
+    Guesses the MIME type of raw file bytes from their signature (the first 12
+    bytes are enough). Returns None for anything but a PDF or a supported image.
     """
-    file_type = get_file_type(file_path)
-    if not file_type:
-        return "Cannot determine file type."
+    head = bytes(data[:12])
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, mime_type in _SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+    return None
+
+def prewarm(pdf=True):
+    """
+    Imports the OCR dependencies and starts this process's Tesseract engines now
+    rather than on the first request; pdf=False leaves out the PDF stack
+    (pdfplumber, pdf2image, Camelot) for image-only use.
+    Returns {module (or "tesseract engines"): seconds taken}.
+    """
+    names = ["pytesseract", "cv2"] + (["pdfplumber", "pdf2image", "camelot"] if pdf else [])
+    timings = prewarm_modules(names)
+    start = time.perf_counter()
+    try:
+        ocr_engine.prewarm(custom_config)
+    except Exception as e:
+        # Engines will be started (and the error reported) on first use instead
+        print(f"Could not start Tesseract engines: {e}")
+    timings["tesseract engines"] = round(time.perf_counter() - start, 3)
+    return timings
 
-    if "pdf" in file_type:
-        print("Detected PDF file.")
-        return extract_text_from_pdf(file_path)
+def init_ocr_worker():
+    """
+    Initializer for OCR worker processes: loads what page OCR needs and starts
+    an engine before the first page arrives. Never raises, as a failing
+    initializer would break the whole pool.
+    """
+    global _in_ocr_worker
+    _in_ocr_worker = True
+    try:
+        prewarm_modules(["pytesseract", "cv2"])
+        ocr_engine.prewarm(custom_config, count=1)
+    except Exception as e:
+        print(f"Could not prewarm OCR worker: {e}")
 
-    elif "image" in file_type:
-        print("Detected image file.")
-        return extract_text_from_image(file_path)
+def ocr_settings():
+    """
+    Returns the settings that affect extracted text; part of the OCR cache key.
+    """
+    return {
+        "custom_config": custom_config,
+        "dpi": ocr_dpi,
+        "scale_percent": ocr_scale_percent,
+        "preprocess_version": preprocess_version,
+        "min_text_layer_chars": min_text_layer_chars,
+        "scan_image_fraction": scan_image_fraction,
+        "min_text_area_fraction": min_text_area_fraction,
+        "raster_mode": raster_mode,
+        "ocr_layout": ocr_layout,
+        "skip_blank_pages": skip_blank_pages,
+        "dedupe_pages": dedupe_pages,
+        "target_glyph_px": target_glyph_px if raster_mode == "adaptive" else None,
+    }
 
+def iter_extract_text(source, filename=None, workers=None, cache=True, report=None, window=None,
+                      executor=None):
+    """
+    Streaming version of extract_text: yields {"page", "text", ...} dicts as pages
+    finish (a single dict for images, cache hits and errors). Joining the "text"
+    values gives exactly what extract_text returns.
+    `window` caps how many PDF pages are rendered at once (default page_window).
+    `executor` is a shared process pool for PDF page OCR, see iter_pdf_pages.
+    """
+    if isinstance(source, (Image.Image, np.ndarray)):
+        file_type = "image"
+    elif filename:
+        file_type = get_file_type(filename)
+    elif isinstance(source, (bytes, bytearray)):
+        file_type = sniff_file_type(source)
     else:
-        return "Unsupported file type."
+        file_type = get_file_type(source)
+
+    if not file_type:
+        yield {"page": None, "text": "Cannot determine file type."}
+        return
+
+    if "pdf" not in file_type and "image" not in file_type:
+        yield {"page": None, "text": "Unsupported file type."}
+        return
+
+    ocr_cache = None
+    if cache:
+        ocr_cache = get_default_cache() if cache is True else cache
+        cache_key = ocr_cache.make_key(source, dict(ocr_settings(), file_type=file_type))
+        cached_text = ocr_cache.get(cache_key)
+        if cached_text is not None:
+            print("Using cached extraction result.")
+            if report is not None:
+                report["cached"] = True
+            yield {"page": None, "text": cached_text, "cached": True}
+            return
+
+    texts = []
+    with tracing.span("extract_text", file_type=file_type) as span:
+        if isinstance(source, (bytes, bytearray)):
+            span.set(bytes=len(source))
+        if "pdf" in file_type:
+            print("Detected PDF file.")
+            for page in iter_pdf_pages(source, workers=workers, report=report, window=window,
+                                       executor=executor):
+                texts.append(page["text"])
+                yield page
+        else:
+            print("Detected image file.")
+            text = extract_text_from_image(source, report=report)
+            texts.append(text)
+            yield {"page": 1, "page_count": 1, "text": text}
+        span.set(pages=len(texts))
+
+    # Only reached when every page was consumed. Don't cache partial results;
+    # a failed page may succeed next time
+    text = "".join(texts)
+    if ocr_cache is not None and "OCR failed]" not in text:
+        ocr_cache.put(cache_key, text)
+
+def extract_text(source, filename=None, workers=None, cache=True, report=None):
+    """
+    Main function to extract text based on file type (PDF or image).
+    `source` is a file path, the raw file bytes, a PIL image or a NumPy array.
+    `filename` is only used to detect the type of in-memory sources.
+    Results are cached by file content and OCR settings; pass cache=False to
+    bypass the cache or an OCRCache instance to use a specific one.
+    If `report` is a dict it is filled with per-page decisions (or cached=True).
+    """
+    pages = iter_extract_text(source, filename=filename, workers=workers, cache=cache, report=report)
+    return "".join(page["text"] for page in pages)
 
 # Example usage:
 if __name__ == "__main__":